@@ -1 +1,25 @@
-RETURN_POLICY = {"description": "Find return policy", "steps": ["Go to bestbuy.com"]}
+RETURN_POLICY = {
+    "description": "Find return policy",
+    "keywords": ["return policy", "returns policy", "refund policy"],
+    "steps": ["Go to bestbuy.com"],
+    # Regexes over the HARPA result that mean the task is answered
+    "completion_patterns": [
+        r"\b\d+[- ]day (return|refund)",
+        r"return (window|period) (is|of) \d+",
+        r"returns? (are )?accepted within \d+",
+    ]
+}
+
+# Profiles checked by match_profile(), in priority order
+PROFILES = {
+    "return_policy": RETURN_POLICY,
+}
+
+
+def match_profile(task_description: str):
+    """Return ``(name, profile)`` for the first profile whose keywords appear in the task, or None"""
+    text = task_description.lower()
+    for name, profile in PROFILES.items():
+        if any(keyword in text for keyword in profile.get("keywords", [])):
+            return name, profile
+    return None
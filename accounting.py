@@ -0,0 +1,186 @@
+import json
+from config import Config
+from state_manager import StateStore, list_task_ids, load_state
+
+# USD per 1M tokens: (prompt, completion, cached prompt)
+DEFAULT_PRICING = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+}
+
+TENANT_PREFIX = "_tenant_"
+
+_pricing = None
+
+
+class BudgetExceeded(Exception):
+    """Raised when a task or tenant has used up its token or cost budget"""
+
+
+def get_pricing() -> dict:
+    """Return model prices, merged with ``Config.MODEL_PRICING_PATH`` overrides"""
+    global _pricing
+    if _pricing is None:
+        pricing = dict(DEFAULT_PRICING)
+        if Config.MODEL_PRICING_PATH:
+            with open(Config.MODEL_PRICING_PATH) as f:
+                pricing.update({model: tuple(prices) for model, prices in json.load(f).items()})
+        _pricing = pricing
+    return _pricing
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Estimated USD cost of one call; unknown models are priced as ``Config.AI_MODEL``"""
+    pricing = get_pricing()
+    prices = pricing.get(model)
+    if prices is None:
+        # Dated snapshots such as gpt-4o-2024-08-06 share their family's price
+        family = max((name for name in pricing if model.startswith(name)), key=len, default=None)
+        prices = pricing.get(family) or pricing.get(Config.AI_MODEL, (0.0, 0.0, 0.0))
+    prompt_price, completion_price, cached_price = prices
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * prompt_price + cached_tokens * cached_price + completion_tokens * completion_price) / 1_000_000
+
+
+def empty_usage() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0, "by_model": {}}
+
+
+def add_usage(totals: dict, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Add one call's usage to a usage dict (as stored in task state) and return its cost"""
+    cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    for target in (totals, totals["by_model"].setdefault(model, {k: v for k, v in empty_usage().items() if k != "by_model"})):
+        target["calls"] += 1
+        target["prompt_tokens"] += prompt_tokens
+        target["completion_tokens"] += completion_tokens
+        target["cached_tokens"] = target.get("cached_tokens", 0) + cached_tokens
+        target["cost_usd"] += cost
+    return cost
+
+
+def usage_from_response(response) -> tuple:
+    """Return ``(prompt_tokens, completion_tokens, cached_tokens)`` from an API response"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached
+
+
+class Budget:
+    """
+    Per-task and per-tenant token/cost limits
+
+    ``check`` returns "ok", "downshift" once usage passes
+    ``downshift_ratio`` of any limit, or "exceeded" once a limit is hit.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, task_tokens: int = None, task_cost_usd: float = None,
+                 tenant_cost_usd: float = None, downshift_ratio: float = None):
+        self.task_tokens = Config.TASK_TOKEN_BUDGET if task_tokens is None else task_tokens
+        self.task_cost_usd = Config.TASK_COST_BUDGET_USD if task_cost_usd is None else task_cost_usd
+        self.tenant_cost_usd = Config.TENANT_COST_BUDGET_USD if tenant_cost_usd is None else tenant_cost_usd
+        self.downshift_ratio = Config.BUDGET_DOWNSHIFT_RATIO if downshift_ratio is None else downshift_ratio
+
+    def check(self, task_usage: dict, tenant_usage: dict = None) -> str:
+        fractions = []
+        if self.task_tokens:
+            fractions.append((task_usage["prompt_tokens"] + task_usage["completion_tokens"]) / self.task_tokens)
+        if self.task_cost_usd:
+            fractions.append(task_usage["cost_usd"] / self.task_cost_usd)
+        if self.tenant_cost_usd and tenant_usage:
+            fractions.append(tenant_usage["cost_usd"] / self.tenant_cost_usd)
+
+        used = max(fractions, default=0.0)
+        if used >= 1.0:
+            return "exceeded"
+        if used >= self.downshift_ratio:
+            return "downshift"
+        return "ok"
+
+
+class TenantLedger:
+    """Aggregated usage per tenant, persisted next to task state"""
+
+    def __init__(self, state_store=None):
+        self.state_store = state_store or StateStore()
+
+    def _key(self, tenant: str) -> str:
+        return f"{TENANT_PREFIX}{tenant}"
+
+    def get(self, tenant: str) -> dict:
+        return self.state_store.load(self._key(tenant)).get("usage") or empty_usage()
+
+    def record(self, tenant: str, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> dict:
+        def apply(state):
+            usage = state.setdefault("usage", empty_usage())
+            add_usage(usage, model, prompt_tokens, completion_tokens, cached_tokens)
+            state["tenant"] = tenant
+        if hasattr(self.state_store, "update"):
+            return self.state_store.update(self._key(tenant), apply)["usage"]
+        state = self.state_store.load(self._key(tenant))
+        apply(state)
+        self.state_store.save(self._key(tenant), state)
+        return state["usage"]
+
+
+def usage_report() -> dict:
+    """Aggregate usage over all persisted tasks and tenants"""
+    report = {"tasks": {}, "tenants": {}, "total": empty_usage()}
+    for task_id in list_task_ids():
+        state = load_state(task_id)
+        usage = state.get("usage")
+        if not usage:
+            continue
+        if task_id.startswith(TENANT_PREFIX):
+            report["tenants"][task_id[len(TENANT_PREFIX):]] = usage
+            continue
+        report["tasks"][task_id] = dict(usage, tenant=state.get("tenant"), status=state.get("status"))
+        total = report["total"]
+        for model, model_usage in usage.get("by_model", {}).items():
+            # Same shape as a task's usage: by_model maps model -> usage dict
+            model_total = total["by_model"].setdefault(
+                model, {key: value for key, value in empty_usage().items() if key != "by_model"})
+            for target in (total, model_total):
+                for key in ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"):
+                    target[key] += model_usage.get(key, 0)
+    return report
+
+
+def print_report(report: dict):
+    print(f"{'task':<32} {'tenant':<12} {'calls':>6} {'prompt':>9} {'cached':>9} {'completion':>11} {'cost $':>9}")
+    for task_id, usage in sorted(report["tasks"].items(), key=lambda item: -item[1]["cost_usd"]):
+        print(f"{task_id:<32.32} {str(usage.get('tenant') or '-'):<12.12} {usage['calls']:>6} "
+              f"{usage['prompt_tokens']:>9} {usage.get('cached_tokens', 0):>9} {usage['completion_tokens']:>11} "
+              f"{usage['cost_usd']:>9.4f}")
+    if report["tenants"]:
+        print("\n💼 Tenants")
+        for tenant, usage in sorted(report["tenants"].items()):
+            print(f"   {tenant:<20} {usage['calls']:>6} calls  ${usage['cost_usd']:.4f}")
+    total = report["total"]
+    print(f"\n💰 Total: {total['calls']} calls, {total['prompt_tokens']} prompt + "
+          f"{total['completion_tokens']} completion tokens, ${total['cost_usd']:.4f}")
+    if total['prompt_tokens']:
+        print(f"🧊 Prompt cache: {total['cached_tokens']} of {total['prompt_tokens']} prompt tokens "
+              f"({total['cached_tokens'] / total['prompt_tokens'] * 100:.1f}%) served from cache")
+    for model, model_usage in sorted(total["by_model"].items()):
+        print(f"   {model:<20} {model_usage['calls']:>6} calls  ${model_usage['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Token and cost usage across persisted tasks')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    args = parser.parse_args()
+    report = usage_report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,314 @@
+import contextvars
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from config import Config
+from state_manager import file_lock, list_task_ids, load_state, write_bytes_atomic
+import state_serializers
+import metrics
+
+DIGEST_PREFIX = "sha256:"
+SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+REFS_SUFFIX = ".refs"
+# Progress step keys holding artifact references: the condensed result and the raw grid response
+STEP_KEYS = ("artifact", "raw_artifact")
+
+ARTIFACT_WRITES = metrics.registry.counter("orchestrator_artifact_writes_total",
+                                           "Artifact store puts, by whether the blob already existed", ("result",))
+
+
+# Store of the running task, for layers below the orchestrator that keep raw data
+_current = contextvars.ContextVar("artifact_store", default=None)
+
+
+class ArtifactNotFound(KeyError):
+    """Raised when no blob exists for a digest"""
+
+
+class ArtifactStore:
+    """
+    Content-addressed, deduplicating blob store for HARPA results and raw grid responses
+
+    Blobs are named by their SHA-256 and sharded two levels deep
+    (``ab/cd/abcd…``), optionally compressed. Every ``put`` adds a reference
+    and ``release`` drops one; ``gc`` deletes blobs nobody references.
+    Reference counts live in ``<blob>.refs`` sidecars updated under one
+    store-wide file lock, so several processes can share a store.
+
+    Args:
+        root: Store directory, defaults to ``Config.ARTIFACT_DIR`` or
+            ``<PERSISTENT_DIR>/artifacts``
+        compression: "none", "gzip" or "zstd" for new blobs
+    """
+
+    def __init__(self, root: str = None, compression: str = None):
+        self.root = root or Config.ARTIFACT_DIR or os.path.join(Config.PERSISTENT_DIR, "artifacts")
+        self.compression = compression or Config.ARTIFACT_COMPRESSION
+        if self.compression not in SUFFIXES:
+            raise ValueError(f"Unknown artifact compression: {self.compression}")
+
+    def _base(self, digest: str) -> str:
+        hexdigest = digest[len(DIGEST_PREFIX):] if digest.startswith(DIGEST_PREFIX) else digest
+        return os.path.join(self.root, hexdigest[:2], hexdigest[2:4], hexdigest)
+
+    def _find(self, base: str):
+        for compression, suffix in SUFFIXES.items():
+            if os.path.exists(base + suffix):
+                return base + suffix, compression
+        return None, None
+
+    def _lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        return file_lock(os.path.join(self.root, ".lock"))
+
+    def _read_refs(self, base: str) -> int:
+        try:
+            with open(base + REFS_SUFFIX) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_refs(self, base: str, count: int):
+        write_bytes_atomic(base + REFS_SUFFIX, str(count).encode())
+
+    def put(self, data) -> dict:
+        """
+        Store ``data`` (bytes or text) and add a reference to it
+
+        Returns:
+            ``{"digest": "sha256:…", "size": n}`` for recording in state
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = DIGEST_PREFIX + hashlib.sha256(data).hexdigest()
+        base = self._base(digest)
+        with self._lock():
+            path, _ = self._find(base)
+            if path is None:
+                os.makedirs(os.path.dirname(base), exist_ok=True)
+                write_bytes_atomic(base + SUFFIXES[self.compression],
+                                   state_serializers.compress(data, self.compression))
+            ARTIFACT_WRITES.labels(result="stored" if path is None else "deduplicated").inc()
+            self._write_refs(base, self._read_refs(base) + 1)
+        return {"digest": digest, "size": len(data)}
+
+    def put_stream(self, chunks, size: int = -1) -> dict:
+        """
+        Store the bytes of an iterable of chunks without adding a reference
+
+        The data is hashed and compressed chunk by chunk into a temporary
+        file that is renamed into place, so it is never held in memory
+        whole. Call ``retain`` for each state that records the digest; until
+        then only ``gc``'s grace period keeps the blob.
+
+        Args:
+            chunks: Iterable of bytes-like chunks
+            size: Total length if known (needed for zstd)
+
+        Returns:
+            ``{"digest": "sha256:…", "size": n}``
+        """
+        import tempfile
+        os.makedirs(self.root, exist_ok=True)
+        sha, total = hashlib.sha256(), 0
+        tmp = tempfile.NamedTemporaryFile(dir=self.root, prefix=".put_", delete=False)
+        try:
+            with tmp:
+                out = state_serializers.compressor(tmp, self.compression, size)
+                with out:
+                    for chunk in chunks:
+                        sha.update(chunk)
+                        total += len(chunk)
+                        out.write(chunk)
+            digest = DIGEST_PREFIX + sha.hexdigest()
+            base = self._base(digest)
+            with self._lock():
+                path, _ = self._find(base)
+                if path is None:
+                    os.makedirs(os.path.dirname(base), exist_ok=True)
+                    os.replace(tmp.name, base + SUFFIXES[self.compression])
+                else:
+                    # Restart the gc grace period of an existing, possibly unreferenced blob
+                    os.utime(path)
+                ARTIFACT_WRITES.labels(result="stored" if path is None else "deduplicated").inc()
+        finally:
+            try:
+                os.remove(tmp.name)
+            except FileNotFoundError:
+                pass
+        return {"digest": digest, "size": total}
+
+    def retain(self, digest: str) -> int:
+        """Add a reference to a stored blob and return the new count; raises ``ArtifactNotFound``"""
+        base = self._base(digest)
+        with self._lock():
+            if self._find(base)[0] is None:
+                raise ArtifactNotFound(digest)
+            count = self._read_refs(base) + 1
+            self._write_refs(base, count)
+        return count
+
+    def get(self, digest: str) -> bytes:
+        path, compression = self._find(self._base(digest))
+        if path is None:
+            raise ArtifactNotFound(digest)
+        with open(path, "rb") as f:
+            return state_serializers.decompress(f.read(), compression)
+
+    def get_text(self, digest: str) -> str:
+        return self.get(digest).decode("utf-8")
+
+    def exists(self, digest: str) -> bool:
+        return self._find(self._base(digest))[0] is not None
+
+    def refcount(self, digest: str) -> int:
+        return self._read_refs(self._base(digest))
+
+    def release(self, digest: str) -> int:
+        """Drop one reference and return the remaining count"""
+        base = self._base(digest)
+        with self._lock():
+            count = max(self._read_refs(base) - 1, 0)
+            self._write_refs(base, count)
+        return count
+
+    def _blobs(self):
+        """Yield ``(base_path, blob_path)`` for every stored blob"""
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith(".") or name.endswith(REFS_SUFFIX):
+                    continue
+                base = os.path.join(directory, name)
+                for suffix in SUFFIXES.values():
+                    if suffix and name.endswith(suffix):
+                        base = base[:-len(suffix)]
+                        break
+                yield base, os.path.join(directory, name)
+
+    def set_refcounts(self, counts: dict):
+        """Overwrite all reference counts, e.g. with counts rebuilt from task state"""
+        with self._lock():
+            for base, _ in self._blobs():
+                self._write_refs(base, counts.get(DIGEST_PREFIX + os.path.basename(base), 0))
+
+    def gc(self, grace_seconds: float = 0) -> tuple:
+        """
+        Delete unreferenced blobs not modified within ``grace_seconds``
+
+        Returns:
+            ``(blobs_removed, bytes_freed)``
+        """
+        removed = freed = 0
+        cutoff = time.time() - grace_seconds
+        with self._lock():
+            for base, path in list(self._blobs()):
+                if self._read_refs(base) > 0 or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                os.remove(path)
+                try:
+                    os.remove(base + REFS_SUFFIX)
+                except FileNotFoundError:
+                    pass
+                removed += 1
+        return removed, freed
+
+    def stats(self) -> dict:
+        blobs = stored = referenced = 0
+        for base, path in self._blobs():
+            blobs += 1
+            stored += os.path.getsize(path)
+            referenced += self._read_refs(base) > 0
+        return {"blobs": blobs, "stored_bytes": stored, "referenced_blobs": referenced}
+
+
+@contextmanager
+def using_store(store):
+    """Make ``store`` (or None) the running task's store for ``current_store()`` inside the block"""
+    token = _current.set(store)
+    try:
+        yield store
+    finally:
+        _current.reset(token)
+
+
+def current_store():
+    """The running task's ArtifactStore, or None outside a task or with the store off"""
+    return _current.get()
+
+
+def state_digests(state: dict) -> list:
+    """Digests referenced by a task state's progress steps"""
+    return [step[key]["digest"] for step in state.get("progress") or [] for key in STEP_KEYS if step.get(key)]
+
+
+def step_result(step: dict, store: ArtifactStore = None) -> str:
+    """Full result text of a progress step, from the store or the inline ``result``"""
+    artifact = step.get("artifact")
+    if artifact:
+        try:
+            return (store or ArtifactStore()).get_text(artifact["digest"])
+        except ArtifactNotFound:
+            return ""
+    return step.get("result", "")
+
+
+def step_raw(step: dict, store: ArtifactStore = None):
+    """Raw grid response body of a progress step, or None if it was not kept"""
+    artifact = step.get("raw_artifact")
+    if not artifact:
+        return None
+    try:
+        return (store or ArtifactStore()).get(artifact["digest"])
+    except ArtifactNotFound:
+        return None
+
+
+def release_task(task_id: str, store: ArtifactStore = None) -> int:
+    """Release every artifact a persisted task references; returns how many"""
+    store = store or ArtifactStore()
+    digests = state_digests(load_state(task_id))
+    for digest in digests:
+        store.release(digest)
+    return len(digests)
+
+
+def rebuild_refcounts(store: ArtifactStore = None) -> int:
+    """Recount references from all persisted task states; returns the blob count referenced"""
+    store = store or ArtifactStore()
+    counts = {}
+    for task_id in list_task_ids():
+        for digest in state_digests(load_state(task_id)):
+            counts[digest] = counts.get(digest, 0) + 1
+    store.set_refcounts(counts)
+    return len(counts)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect and garbage-collect stored HARPA results')
+    parser.add_argument('command', choices=['stats', 'get', 'release', 'rescan', 'gc'])
+    parser.add_argument('digest', nargs='?', help='Artifact digest for "get"')
+    parser.add_argument('--task-id', action='append', help='Task IDs for "release" (repeatable)')
+    parser.add_argument('--grace-seconds', type=float, default=3600, help='Keep unreferenced blobs this recent')
+
+    args = parser.parse_args()
+    store = ArtifactStore()
+
+    if args.command == 'get':
+        if not args.digest:
+            parser.error('"get" needs a digest')
+        print(store.get_text(args.digest))
+    elif args.command == 'release':
+        for task_id in args.task_id or []:
+            print(f"🔓 {task_id}: released {release_task(task_id, store)} artifacts")
+    elif args.command == 'rescan':
+        print(f"🔁 Rebuilt reference counts: {rebuild_refcounts(store)} referenced blobs")
+    elif args.command == 'gc':
+        removed, freed = store.gc(args.grace_seconds)
+        print(f"🧹 Removed {removed} unreferenced blobs, freed {freed} bytes")
+    else:
+        stats = store.stats()
+        print(f"📦 {stats['blobs']} blobs ({stats['referenced_blobs']} referenced), {stats['stored_bytes']} bytes on disk")
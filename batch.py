@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from config import Config
+from log_utils import get_logger
+from scheduling import priority_rank
+
+logger = get_logger("batch")
+
+# Events after which run_task returns; the last one seen is the task's status
+TERMINAL_EVENTS = ("completed", "incomplete", "cancelled", "deadline_exceeded", "budget_exceeded")
+TASK_KEYS = ("task", "task_id", "tenant", "priority", "deadline")
+
+
+class TaskOutcome:
+    """
+    How one task of a ``run_many`` batch ended
+
+    ``status`` is "completed", "incomplete", "cancelled", "deadline_exceeded",
+    "budget_exceeded", "failed" (run_task gave up) or "error" (run_task
+    raised; ``error`` holds the exception). Only "completed" counts as
+    ``ok``: an incomplete task may still return a progress message.
+    """
+
+    __slots__ = ("index", "task", "task_id", "result", "status", "error", "seconds", "iterations", "usage")
+
+    def __init__(self, index: int, task: str, task_id: str):
+        self.index = index
+        self.task = task
+        self.task_id = task_id
+        self.result = None
+        self.status = "failed"
+        self.error = None
+        self.seconds = 0.0
+        self.iterations = 0
+        self.usage = {}
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "completed"
+
+    def __repr__(self):
+        return f"TaskOutcome({self.index}, {self.task_id!r}, status={self.status!r})"
+
+
+def task_specs(tasks) -> list:
+    """
+    Normalize ``tasks`` to ``run_task`` keyword dicts, checking them before anything runs
+
+    Each task is a description string or a dict with "task" and optionally
+    "task_id", "tenant", "priority" and "deadline". Tasks without an ID get
+    one unique to this batch, so their state never collides with another run.
+    """
+    prefix = f"batch_{os.urandom(4).hex()}"
+    specs, seen = [], set()
+    for index, task in enumerate(tasks):
+        spec = {"task": task} if isinstance(task, str) else dict(task)
+        unknown = set(spec) - set(TASK_KEYS)
+        if unknown:
+            raise ValueError(f"Task {index}: unknown keys {', '.join(sorted(unknown))}")
+        if not spec.get("task"):
+            raise ValueError(f"Task {index}: 'task' is required")
+        if spec.get("priority"):
+            priority_rank(spec["priority"])
+        spec.setdefault("task_id", f"{prefix}_{index}")
+        if spec["task_id"] in seen:
+            raise ValueError(f"Task {index}: duplicate task_id {spec['task_id']!r}")
+        seen.add(spec["task_id"])
+        specs.append(spec)
+    return specs
+
+
+class BatchRun:
+    """
+    Tasks running in parallel on one Orchestrator; iterate to get their outcomes
+
+    Every task gets its own messages, state and deadline (``run_task`` keeps
+    them local), while the OpenAI client, HARPA connection pool and the
+    model/grid limiters are shared. Iteration yields a ``TaskOutcome`` per
+    task, in submission order or as each one finishes, and never raises for
+    a failed task.
+
+    Args:
+        orchestrator: Orchestrator whose ``run_task`` runs each task
+        tasks: Description strings or dicts (see ``task_specs``)
+        max_workers: Tasks run at once (default ``RUN_MANY_WORKERS``)
+        ordered: Yield outcomes in submission order rather than as completed
+        on_event: Optional callable receiving every task's progress events
+        cancel_event: threading.Event stopping every task; ``cancel()`` sets it
+        **defaults: ``tenant``, ``priority`` or ``deadline`` for tasks that
+            do not set their own
+    """
+
+    def __init__(self, orchestrator, tasks, max_workers: int = None, ordered: bool = True, on_event=None,
+                 cancel_event=None, **defaults):
+        unknown = set(defaults) - set(TASK_KEYS[2:])
+        if unknown:
+            raise TypeError(f"Unexpected arguments: {', '.join(sorted(unknown))}")
+        self.orchestrator = orchestrator
+        self.ordered = ordered
+        self.on_event = on_event
+        self.cancel_event = cancel_event or threading.Event()
+        if defaults.get("priority"):
+            priority_rank(defaults["priority"])
+        self.specs = [dict(defaults, **spec) for spec in task_specs(tasks)]
+        self.outcomes = [TaskOutcome(index, spec["task"], spec["task_id"]) for index, spec in enumerate(self.specs)]
+
+        workers = max(1, min(max_workers or Config.RUN_MANY_WORKERS, len(self.specs) or 1))
+        logger.info("📦 Running %d tasks on %d threads", len(self.specs), workers)
+        self._lock = threading.Lock()
+        self._remaining = len(self.specs)
+        self._started = time.perf_counter()
+        self._finished = self._started if not self.specs else None
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run_many")
+        self._futures = [pool.submit(self._run, index) for index in range(len(self.specs))]
+        # Queued tasks still run; the threads exit once the last one is done
+        pool.shutdown(wait=False)
+
+    def _run(self, index: int) -> TaskOutcome:
+        spec, outcome = self.specs[index], self.outcomes[index]
+
+        def on_event(event: dict):
+            if event["type"] == "iteration":
+                outcome.iterations += 1
+            elif event["type"] in TERMINAL_EVENTS:
+                outcome.status = event["type"]
+            if self.on_event:
+                self.on_event(event)
+
+        start = time.perf_counter()
+        try:
+            outcome.result = self.orchestrator.run_task(
+                spec["task"], spec["task_id"], on_event=on_event, cancel_event=self.cancel_event,
+                tenant=spec.get("tenant"), priority=spec.get("priority"), deadline=spec.get("deadline"))
+        except Exception as e:
+            logger.error("❌ Task %s raised: %s", spec["task_id"], e)
+            outcome.status, outcome.error = "error", e
+        outcome.seconds = time.perf_counter() - start
+        if outcome.status == "failed" and outcome.result is not None:
+            outcome.status = "completed"
+        try:
+            outcome.usage = self.orchestrator.state_store.load(spec["task_id"]).get("usage") or {}
+        except Exception as e:
+            logger.debug("No usage recorded for %s: %s", spec["task_id"], e)
+        with self._lock:
+            self._remaining -= 1
+            if not self._remaining:
+                self._finished = time.perf_counter()
+        return outcome
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def __iter__(self):
+        futures = self._futures if self.ordered else as_completed(self._futures)
+        for future in futures:
+            yield future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Leaving early (break or an exception) stops what is still running
+        if not self.done():
+            self.cancel()
+        self.wait()
+
+    def results(self) -> list:
+        """Every outcome in submission order, waiting for the batch to finish"""
+        self.wait()
+        return list(self.outcomes)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until every task has finished; False if ``timeout`` ran out first"""
+        end = None if timeout is None else time.monotonic() + timeout
+        for future in self._futures:
+            try:
+                future.exception(None if end is None else max(end - time.monotonic(), 0))
+            except TimeoutError:
+                return False
+        return True
+
+    def done(self) -> bool:
+        return all(future.done() for future in self._futures)
+
+    def cancel(self):
+        """Stop every task: running ones at their next check, queued ones as soon as they start"""
+        self.cancel_event.set()
+
+    def stats(self) -> dict:
+        """Counts, throughput, latency and token totals over the tasks finished so far"""
+        import statistics
+        finished = [outcome for future, outcome in zip(self._futures, self.outcomes) if future.done()]
+        wall = (self._finished or time.perf_counter()) - self._started
+        durations = [outcome.seconds for outcome in finished]
+        by_status = {}
+        for outcome in finished:
+            by_status[outcome.status] = by_status.get(outcome.status, 0) + 1
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+        for outcome in finished:
+            for key in usage:
+                usage[key] += outcome.usage.get(key, 0)
+        return {
+            "tasks": len(self.outcomes),
+            "finished": len(finished),
+            "succeeded": sum(outcome.ok for outcome in finished),
+            "failed": sum(not outcome.ok for outcome in finished),
+            "by_status": by_status,
+            "iterations": sum(outcome.iterations for outcome in finished),
+            "wall_s": wall,
+            "tasks_per_s": len(finished) / wall if wall else 0.0,
+            "task_p50_ms": statistics.median(durations) * 1000 if durations else 0.0,
+            "task_max_ms": max(durations) * 1000 if durations else 0.0,
+            **usage,
+        }
@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from batch import TERMINAL_EVENTS
+from config import Config
+from mock_servers import MockGridServer, MockOpenAIServer
+
+
+class _IterationCounter:
+    def __init__(self):
+        self.count = 0
+        self.status = None
+
+    def __call__(self, event: dict):
+        if event["type"] == "iteration":
+            self.count += 1
+        elif event["type"] in TERMINAL_EVENTS:
+            self.status = event["type"]
+
+
+def _configure(grid: MockGridServer, model: MockOpenAIServer, state_dir: str):
+    Config.HARPA_API_URL = grid.url + "/api/v1/grid"
+    Config.OPENAI_BASE_URL = model.url + "/v1"
+    Config.OPENAI_API_KEY = "sk-benchmark"
+    Config.HARPA_API_KEY = "harpa-benchmark"
+    Config.PERSISTENT_DIR = state_dir
+
+
+def _run_one(orchestrator, index: int, prefix: str) -> tuple:
+    counter = _IterationCounter()
+    start = time.perf_counter()
+    result = orchestrator.run_task(f"Benchmark task {index}", f"{prefix}_{index}", on_event=counter)
+    return time.perf_counter() - start, counter.count, result is not None and counter.status == "completed"
+
+
+def measure_sequential(orchestrator, grid, model, tasks: int) -> dict:
+    """Run tasks one at a time and attribute wall time not spent in mock latency to overhead"""
+    grid.reset_stats()
+    model.reset_stats()
+    durations, iterations, successes = [], 0, 0
+    for index in range(tasks):
+        duration, count, ok = _run_one(orchestrator, index, "seq")
+        durations.append(duration)
+        iterations += count
+        successes += ok
+
+    wall = sum(durations)
+    injected = grid.stats()["injected_latency_s"] + model.stats()["injected_latency_s"]
+    overhead = max(wall - injected, 0.0)
+    return {
+        "tasks": tasks,
+        "iterations": iterations,
+        "success_rate": successes / tasks if tasks else 0.0,
+        "wall_s": wall,
+        "injected_latency_s": injected,
+        "overhead_per_iteration_ms": overhead / iterations * 1000 if iterations else 0.0,
+        "task_p50_ms": statistics.median(durations) * 1000 if durations else 0.0,
+        "task_max_ms": max(durations) * 1000 if durations else 0.0,
+    }
+
+
+def measure_throughput(orchestrator, tasks: int, concurrency: int) -> dict:
+    """Run tasks on ``concurrency`` threads sharing one Orchestrator, via ``run_many``"""
+    batch = orchestrator.run_many([{"task": f"Benchmark task {index}", "task_id": f"c{concurrency}_{index}"}
+                                   for index in range(tasks)], max_workers=concurrency)
+    batch.wait()
+    stats = batch.stats()
+    wall = stats["wall_s"]
+    return {
+        "concurrency": concurrency,
+        "tasks": tasks,
+        "wall_s": wall,
+        "tasks_per_s": stats["tasks_per_s"],
+        "iterations_per_s": stats["iterations"] / wall if wall else 0.0,
+        "success_rate": stats["succeeded"] / tasks if tasks else 0.0,
+    }
+
+
+def measure_memory(orchestrator, tasks: int) -> dict:
+    """Report traced memory growth across ``tasks`` sequential runs after a warm-up task"""
+    _run_one(orchestrator, 0, "mem_warmup")
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for index in range(tasks):
+            _run_one(orchestrator, index, "mem")
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "tasks": tasks,
+        "growth_kb": (after - before) / 1024,
+        "growth_per_task_kb": (after - before) / 1024 / tasks if tasks else 0.0,
+        "peak_kb": peak / 1024,
+    }
+
+
+def check_spilled_text(results: int = 30) -> bool:
+    """The model must get the same text for a reply whether or not its body was spilled to disk"""
+    from harpa_integration import HARPAIntegration
+    from harpa_models import CommandReply, SerpReply
+    from response_stream import SpooledBody
+
+    harpa = HARPAIntegration()
+    payloads = [
+        (SerpReply, {"status": "ok", "query": "benchmark", "results": [
+            {"title": f"Result {index}", "url": f"https://example.com/{index}", "snippet": f"Item {index} ${index}.99"}
+            for index in range(results)]}),
+        (CommandReply, {"status": "ok", "results": [{"name": f"Item {index}", "price": index} for index in range(results)]}),
+        (CommandReply, {"status": "ok", "message": "\n".join(f"Item {index} costs ${index}.99" for index in range(results))}),
+    ]
+    for reply_type, payload in payloads:
+        body = json.dumps(payload).encode("utf-8")
+        in_memory = harpa.text(reply_type.parse(body))
+        spooled = SpooledBody.read(iter([body]), 0, 1)
+        reply = harpa._reply(spooled, reply_type, 200, 0.0)
+        try:
+            spilled = harpa.text(reply)
+        finally:
+            reply.release()
+        if not in_memory or spilled != in_memory:
+            return False
+    return True
+
+
+def check_spilled_message_bounded(lines: int = 200000, spool_bytes: int = 65536) -> bool:
+    """
+    A spilled command reply whose bulk is one long ``message`` must not be loaded whole
+
+    The model must still get the same lines as for the reply held in memory,
+    while reading it takes far less memory than the body's size.
+    """
+    from harpa_integration import HARPAIntegration
+    from harpa_models import CommandReply
+    from response_stream import SpooledBody
+
+    harpa = HARPAIntegration(type("SpoolConfig", (Config,), {"GRID_SPOOL_BYTES": spool_bytes}))
+    message = "\n".join(f"Item {index} costs ${index}.99" for index in range(lines))
+    body = json.dumps({"status": "ok", "message": message}).encode("utf-8")
+    in_memory = harpa.text(CommandReply.parse(body))
+    spooled = SpooledBody.read(iter([body]), 0, spool_bytes)
+    tracemalloc.start()
+    try:
+        reply = harpa._reply(spooled, CommandReply, 200, 0.0)
+        try:
+            spilled = harpa.text(reply)
+        finally:
+            reply.release()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Only the count in a trailing "[… N more lines omitted]" may differ, as the spilled text was cut
+    kept = [text.rsplit("\n[…", 1)[0] for text in (in_memory, spilled)]
+    return bool(in_memory) and kept[0] == kept[1] and peak < len(body) / 4
+
+
+def check_incomplete_not_ok() -> bool:
+    """A task that ran out of iterations must not count as a success, even though it returns a message"""
+    from batch import BatchRun
+
+    class _Stub:
+        state_store = type("_NoState", (), {"load": staticmethod(lambda task_id: {})})()
+
+        def run_task(self, task, task_id, on_event=None, **kwargs):
+            on_event({"type": "iteration", "iteration": 1})
+            if task == "incomplete":
+                on_event({"type": "incomplete", "iteration": 1})
+                return "Task incomplete but made progress: 1 steps completed"
+            on_event({"type": "completed", "iteration": 1, "result": "done"})
+            return "done"
+
+    with BatchRun(_Stub(), ["incomplete", "complete"], max_workers=2) as batch:
+        incomplete, complete = batch.results()
+        stats = batch.stats()
+    return (not incomplete.ok and incomplete.status == "incomplete" and complete.ok
+            and stats["succeeded"] == 1 and stats["failed"] == 1)
+
+
+def run_benchmarks(tasks: int = 20, turns: int = 3, concurrency_levels=(1, 4, 16),
+                   grid_latency: str = "fixed:20", model_latency: str = "fixed:50",
+                   payload_bytes: int = 2000, error_rate: float = 0.0, seed: int = 1) -> dict:
+    """Run the full offline suite against local mock servers and return a report dict"""
+    from orchestrator import Orchestrator
+
+    grid = MockGridServer(grid_latency, error_rate, payload_bytes, seed).start()
+    model = MockOpenAIServer(model_latency, error_rate, turns, seed).start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            _configure(grid, model, state_dir)
+            orchestrator = Orchestrator()
+            # Task output is part of the measured hot path but not of the report
+            with contextlib.redirect_stdout(io.StringIO()) as sink:
+                _run_one(orchestrator, 0, "warmup")
+                sequential = measure_sequential(orchestrator, grid, model, tasks)
+                sink.seek(0)
+                sink.truncate()
+                throughput = []
+                for level in concurrency_levels:
+                    throughput.append(measure_throughput(orchestrator, tasks, level))
+                    sink.seek(0)
+                    sink.truncate()
+                memory = measure_memory(orchestrator, tasks)
+    finally:
+        grid.stop()
+        model.stop()
+
+    return {
+        "settings": {
+            "tasks": tasks, "turns": turns, "grid_latency": grid_latency,
+            "model_latency": model_latency, "payload_bytes": payload_bytes,
+            "error_rate": error_rate, "seed": seed,
+        },
+        "sequential": sequential,
+        "throughput": throughput,
+        "memory": memory,
+        "checks": {"spilled_text_matches": check_spilled_text(),
+                   "spilled_message_bounded": check_spilled_message_bounded(),
+                   "incomplete_not_ok": check_incomplete_not_ok()},
+    }
+
+
+def compare_to_baseline(report: dict, baseline: dict, max_regression_pct: float) -> list:
+    """Return human-readable regressions beyond ``max_regression_pct``"""
+    regressions = []
+    checks = [("sequential", "overhead_per_iteration_ms", True), ("memory", "growth_per_task_kb", True)]
+    for section, key, lower_is_better in checks:
+        old, new = baseline[section][key], report[section][key]
+        if old and lower_is_better and new > old * (1 + max_regression_pct / 100):
+            regressions.append(f"{section}.{key}: {old:.2f} → {new:.2f}")
+    old_rates = {row["concurrency"]: row["tasks_per_s"] for row in baseline.get("throughput", [])}
+    for row in report["throughput"]:
+        old = old_rates.get(row["concurrency"])
+        if old and row["tasks_per_s"] < old * (1 - max_regression_pct / 100):
+            regressions.append(f"throughput@{row['concurrency']}: {old:.2f} → {row['tasks_per_s']:.2f} tasks/s")
+    return regressions
+
+
+def print_report(report: dict):
+    seq = report["sequential"]
+    print("📏 Sequential")
+    print(f"   iterations: {seq['iterations']} over {seq['tasks']} tasks, success {seq['success_rate']:.0%}")
+    print(f"   overhead per iteration: {seq['overhead_per_iteration_ms']:.2f} ms")
+    print(f"   task p50 / max: {seq['task_p50_ms']:.1f} / {seq['task_max_ms']:.1f} ms")
+    print("🚀 Throughput")
+    for row in report["throughput"]:
+        print(f"   concurrency {row['concurrency']:>3}: {row['tasks_per_s']:.2f} tasks/s, "
+              f"{row['iterations_per_s']:.2f} iterations/s, success {row['success_rate']:.0%}")
+    mem = report["memory"]
+    print("🧠 Memory")
+    print(f"   growth: {mem['growth_kb']:.1f} KB ({mem['growth_per_task_kb']:.2f} KB/task), peak {mem['peak_kb']:.1f} KB")
+    print("🧪 Checks")
+    for name, passed in report.get("checks", {}).items():
+        print(f"   {name}: {'✅' if passed else '❌'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline orchestrator benchmark against mock HARPA and OpenAI servers')
+    parser.add_argument('--tasks', type=int, default=20, help='Tasks per measurement')
+    parser.add_argument('--turns', type=int, default=3, help='Model turns per task (last one completes)')
+    parser.add_argument('--concurrency', type=str, default="1,4,16", help='Comma-separated concurrency levels')
+    parser.add_argument('--grid-latency', type=str, default="fixed:20", help='none | fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--model-latency', type=str, default="fixed:50", help='Same format as --grid-latency')
+    parser.add_argument('--payload-bytes', type=int, default=2000, help='Page text size returned by the grid')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock requests that fail with HTTP 500')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for latency and errors')
+    parser.add_argument('--output', type=str, help='Write the JSON report here')
+    parser.add_argument('--baseline', type=str, help='Compare against a previous JSON report')
+    parser.add_argument('--max-regression', type=float, default=10.0, help='Allowed regression vs baseline in percent')
+
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        tasks=args.tasks, turns=args.turns,
+        concurrency_levels=[int(level) for level in args.concurrency.split(",")],
+        grid_latency=args.grid_latency, model_latency=args.model_latency,
+        payload_bytes=args.payload_bytes, error_rate=args.error_rate, seed=args.seed,
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not all(report["checks"].values()):
+        print("❌ Consistency checks failed")
+        raise SystemExit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            raise SystemExit(1)
+        print("✅ No regressions vs baseline")
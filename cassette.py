@@ -0,0 +1,580 @@
+import contextvars
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from config import Config
+from log_utils import get_logger
+from response_stream import SpooledBody
+
+logger = get_logger("cassette")
+
+CASSETTE_VERSION = 1
+
+_current = contextvars.ContextVar("cassette", default=None)
+# Recorded errors from these packages are raised again as their own class on replay
+ERROR_PACKAGES = ("builtins", "requests", "urllib3", "openai", "httpx")
+
+
+class CassetteMiss(Exception):
+    """Raised on replay when the cassette has no interaction left for a request"""
+
+
+class ReplayedError(Exception):
+    """A recorded error whose original class could not be rebuilt on replay"""
+
+
+def request_key(kind: str, request) -> str:
+    """Short stable hash identifying a model or grid request"""
+    canonical = json.dumps([kind, request], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _plain(value):
+    """JSON-ready copy of an SDK response (pydantic model or plain objects)"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if hasattr(value, "__dict__"):
+        return {key: _plain(item) for key, item in vars(value).items() if not key.startswith("_")}
+    return value
+
+
+def _namespace(value):
+    """Attribute-access view of a recorded response, as the orchestrator reads SDK objects"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+def _error(e: Exception) -> dict:
+    return {"type": type(e).__name__, "module": type(e).__module__, "message": str(e)}
+
+
+def replayed_error(error: dict) -> Exception:
+    """
+    The recorded exception as its original class, e.g. ``requests.exceptions.Timeout``
+
+    Only classes from ``ERROR_PACKAGES`` are imported. Errors that cannot
+    be built from their message alone (SDK errors needing a live request or
+    response) are created without calling ``__init__``, so they carry the
+    message but no response.
+    Anything else becomes a ``ReplayedError``.
+    """
+    module_name = error.get("module") or ""
+    cls = None
+    if module_name.split(".")[0] in ERROR_PACKAGES:
+        try:
+            cls = getattr(importlib.import_module(module_name), error["type"], None)
+        except ImportError:
+            cls = None
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        return ReplayedError(error["message"])
+    try:
+        e = cls(error["message"])
+        # Some constructors take something else first (openai.APITimeoutError takes the request)
+        if str(e) == error["message"]:
+            return e
+    except Exception:
+        pass
+    e = cls.__new__(cls)
+    Exception.__init__(e, error["message"])
+    return e
+
+
+def _grid_request(data) -> dict:
+    # The timeout sent to HARPA depends on how much of the deadline was left
+    request = json.loads(data) if data else {}
+    request.pop("timeout", None)
+    return request
+
+
+class Cassette:
+    """
+    Model and grid interactions of one task run, in the order they happened
+
+    Replay hands back, for each request, the first unused interaction with
+    the same request; when the code under test changed a request (a prompt
+    edit, say) it falls back to the next unused interaction of that kind,
+    counting a miss.
+
+    Args:
+        meta: Task, task_id, tenant, priority, starting state and outcome
+        interactions: ``{"kind", "key", "request", "response" or "error", "seconds"}`` dicts
+    """
+
+    def __init__(self, meta: dict = None, interactions: list = None):
+        self.meta = meta or {}
+        self.interactions = interactions or []
+        self.misses = 0
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, request, response=None, error: dict = None, seconds: float = 0.0):
+        entry = {"kind": kind, "key": request_key(kind, request), "request": request, "seconds": round(seconds, 6)}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        with self._lock:
+            self.interactions.append(entry)
+
+    def take(self, kind: str, request, strict: bool = False) -> dict:
+        """
+        The recorded interaction to replay for ``request``
+
+        Raises:
+            CassetteMiss: nothing of ``kind`` is left, or the request does
+                not match exactly and ``strict`` is set
+        """
+        key = request_key(kind, request)
+        with self._lock:
+            fallback = None
+            for index, entry in enumerate(self.interactions):
+                if index in self._used or entry["kind"] != kind:
+                    continue
+                if entry["key"] == key:
+                    self._used.add(index)
+                    return entry
+                if fallback is None:
+                    fallback = index
+            self.misses += 1
+            if fallback is None or strict:
+                raise CassetteMiss(f"No recorded {kind} interaction matches request {key}")
+            self._used.add(fallback)
+            return self.interactions[fallback]
+
+    def count(self, kind: str) -> int:
+        return sum(entry["kind"] == kind for entry in self.interactions)
+
+    def unused(self) -> int:
+        return len(self.interactions) - len(self._used)
+
+    def save(self, path: str):
+        """
+        Write as JSON, gzip-compressed when ``path`` ends in ".gz"
+
+        Grid bodies recorded to spill files are streamed into the output
+        rather than read into memory.
+        """
+        opener = gzip.open if path.endswith(".gz") else open
+        tmp_path = f"{path}.tmp"
+        with opener(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(f'{{"version": {CASSETTE_VERSION}, "meta": {json.dumps(self.meta)}, "interactions": [')
+            for index, entry in enumerate(self.interactions):
+                if index:
+                    f.write(", ")
+                body = (entry.get("response") or {}).get("body")
+                if not isinstance(body, SpooledBody):
+                    json.dump(entry, f)
+                    continue
+                # Both dicts are non-empty, so dropping their closing brace leaves room for one more key
+                response = {key: value for key, value in entry["response"].items() if key != "body"}
+                f.write(json.dumps({key: value for key, value in entry.items() if key != "response"})[:-1])
+                f.write(f', "response": {json.dumps(response)[:-1]}, "body": "')
+                _write_json_text(f, body.path)
+                f.write('"}}')
+            f.write("]}")
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """Delete the spill files of recorded grid bodies; call once the cassette is saved"""
+        for entry in self.interactions:
+            body = (entry.get("response") or {}).get("body")
+            if isinstance(body, SpooledBody):
+                body.close()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{path}: unsupported cassette version {data.get('version')!r}")
+        return cls(data["meta"], data["interactions"])
+
+
+def _write_json_text(f, path: str, chunk_size: int = 65536):
+    """Write the file at ``path`` to ``f`` as the contents of a JSON string, a chunk at a time"""
+    import codecs
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    with open(path, "rb") as body:
+        for chunk in iter(lambda: body.read(chunk_size), b""):
+            f.write(json.dumps(decoder.decode(chunk))[1:-1])
+    f.write(json.dumps(decoder.decode(b"", final=True))[1:-1])
+
+
+def is_recording() -> bool:
+    """True inside a ``recording`` block, i.e. while the running task's calls go into a cassette"""
+    return _current.get() is not None
+
+
+def cassette_path(directory: str, task_id: str) -> str:
+    return os.path.join(directory, f"{task_id}_{os.urandom(6).hex()}.json.gz")
+
+
+@contextmanager
+def recording(path: str, **meta):
+    """
+    Record the model and grid calls made inside the block into a cassette saved at ``path``
+
+    Only clients wrapped in ``RecordingClient``/``RecordingSession`` record;
+    concurrent tasks each record into their own cassette.
+    """
+    cassette = Cassette(dict(meta, recorded_at=time.time()))
+    token = _current.set(cassette)
+    start = time.perf_counter()
+    try:
+        yield cassette
+    finally:
+        _current.reset(token)
+        cassette.meta["seconds"] = round(time.perf_counter() - start, 6)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            cassette.save(path)
+            logger.debug("📼 Recorded %d interactions to %s", len(cassette.interactions), path)
+        except OSError as e:
+            logger.warning("⚠️ Could not save cassette %s: %s", path, e)
+        finally:
+            cassette.close()
+
+
+class RecordingClient:
+    """
+    OpenAI client wrapper adding each chat completion to the running task's cassette
+
+    Outside a ``recording`` block calls go straight through.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _create(self, **kwargs):
+        cassette = _current.get()
+        if cassette is None:
+            return self.client.chat.completions.create(**kwargs)
+        # A copy: the orchestrator keeps appending to the messages list
+        request = _plain({key: value for key, value in kwargs.items() if key != "timeout"})
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            cassette.add("model", request, error=_error(e), seconds=time.perf_counter() - start)
+            raise
+        cassette.add("model", request, _plain(response), seconds=time.perf_counter() - start)
+        return response
+
+
+class _RecordedResponse:
+    """
+    Streams a live grid response through, keeping the body for the cassette
+
+    The copy is held in memory up to ``GRID_SPOOL_BYTES`` and spilled to
+    ``GRID_SPILL_DIR`` past that, like the body the orchestrator reads.
+    """
+
+    def __init__(self, response, cassette: Cassette, request: dict, start: float):
+        self.response = response
+        self.cassette = cassette
+        self.request = request
+        self.start = start
+        self.body = SpooledBody(Config.GRID_SPOOL_BYTES, Config.GRID_SPILL_DIR)
+        self.complete = False
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def iter_content(self, chunk_size: int = 1, **kwargs):
+        for chunk in self.response.iter_content(chunk_size=chunk_size, **kwargs):
+            self.body.write(chunk)
+            yield chunk
+        self.complete = True
+
+    def close(self):
+        if self.cassette is not None:
+            body = None
+            if not self.complete:
+                self.body.close()
+            elif self.body.in_memory:
+                body = self.body.getvalue().decode("utf-8", "surrogateescape")
+                self.body.close()
+            else:
+                # Written into the cassette from the spill file on save
+                self.body.finish()
+                body = self.body
+            self.cassette.add("grid", self.request, {
+                "status_code": self.response.status_code,
+                "headers": {key.lower(): value for key, value in self.response.headers.items()},
+                "body": body,
+            }, seconds=time.perf_counter() - self.start)
+            self.cassette = None
+        self.response.close()
+
+
+class RecordingSession:
+    """
+    ``requests.Session`` wrapper adding each grid POST to the running task's cassette
+
+    Bodies are kept only if they were read to the end; outside a
+    ``recording`` block requests go straight through.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def post(self, url, data=None, **kwargs):
+        cassette = _current.get()
+        if cassette is None:
+            return self.session.post(url, data=data, **kwargs)
+        request = _grid_request(data)
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, data=data, **kwargs)
+        except Exception as e:
+            cassette.add("grid", request, error=_error(e), seconds=time.perf_counter() - start)
+            raise
+        return _RecordedResponse(response, cassette, request, start)
+
+
+class _Headers(dict):
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class _ReplayResponse:
+    def __init__(self, response: dict):
+        self.status_code = response["status_code"]
+        self.headers = _Headers(response.get("headers") or {})
+        body = response.get("body")
+        self.body = b"" if body is None else body.encode("utf-8", "surrogateescape")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def iter_content(self, chunk_size: int = 1, **kwargs):
+        for offset in range(0, len(self.body), chunk_size):
+            yield self.body[offset:offset + chunk_size]
+
+    def close(self):
+        pass
+
+
+class Replayer:
+    """
+    Serves a cassette back as an OpenAI client (``.client``) and grid session (``.session``)
+
+    Args:
+        cassette: Recorded run
+        latency_scale: Fraction of each recorded latency to wait before
+            answering; 1.0 replays original timing, 0.0 answers at once
+        strict: Raise ``CassetteMiss`` unless a request matches exactly
+    """
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0, strict: bool = False):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.waited = 0.0
+        self._lock = threading.Lock()
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._create)))
+        self.session = SimpleNamespace(post=self._post, close=lambda: None)
+
+    def _play(self, kind: str, request) -> dict:
+        entry = self.cassette.take(kind, request, self.strict)
+        delay = entry["seconds"] * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                self.waited += delay
+        if "error" in entry:
+            raise replayed_error(entry["error"])
+        return entry["response"]
+
+    def _create(self, **kwargs):
+        return _namespace(self._play("model", {key: value for key, value in kwargs.items() if key != "timeout"}))
+
+    def _post(self, url, data=None, **kwargs):
+        return _ReplayResponse(self._play("grid", _grid_request(data)))
+
+
+class MemoryStateStore:
+    """State store kept in memory, so replays never touch ``PERSISTENT_DIR``"""
+
+    def __init__(self, states: dict = None):
+        self.states = {task_id: json.dumps(state) for task_id, state in (states or {}).items()}
+        self._lock = threading.Lock()
+
+    def load(self, task_id: str) -> dict:
+        with self._lock:
+            saved = self.states.get(task_id)
+        return json.loads(saved) if saved else {"task": task_id, "progress": [], "version": 0}
+
+    def save(self, task_id: str, state: dict):
+        state["version"] = state.get("version", 0) + 1
+        with self._lock:
+            self.states[task_id] = json.dumps(state)
+
+    def update(self, task_id: str, update_fn) -> dict:
+        with self._lock:
+            saved = self.states.get(task_id)
+            state = json.loads(saved) if saved else {"task": task_id, "progress": [], "version": 0}
+            state = update_fn(state) or state
+            state["version"] = state.get("version", 0) + 1
+            self.states[task_id] = json.dumps(state)
+        return state
+
+
+def latency_scale(latency) -> float:
+    """``"original"`` → 1.0, ``"zero"`` → 0.0, or a number such as ``0.5``"""
+    if latency == "original":
+        return 1.0
+    if latency == "zero":
+        return 0.0
+    return float(latency)
+
+
+def replay(cassette: Cassette, latency="zero", strict: bool = False, config=Config) -> dict:
+    """
+    Run a recorded task again offline and measure it
+
+    The task starts from the state it was recorded with, in a memory-only
+    state store. Wall time minus the replayed latency is the orchestrator's
+    own overhead.
+
+    Returns:
+        Report dict: iterations, result_matches, wall_s, replayed_latency_s,
+        overhead_per_iteration_ms, model/grid calls, misses and unused
+        interactions
+    """
+    import tempfile
+    from orchestrator import Orchestrator
+    from harpa_integration import HARPAIntegration
+    from artifact_store import ArtifactStore
+
+    meta = cassette.meta
+    replay_config = type("ReplayConfig", (config,), {"RECORD_DIR": None})
+    replayer = Replayer(cassette, latency_scale(latency), strict)
+    task_id = meta.get("task_id", "replay")
+    iterations = []
+
+    def on_event(event: dict):
+        if event["type"] == "iteration":
+            iterations.append(event["iteration"])
+
+    # Artifacts go to a scratch directory so replays leave no trace
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        orchestrator = Orchestrator(
+            client=replayer.client, config=replay_config,
+            state_store=MemoryStateStore({task_id: meta["state"]} if meta.get("state") else None),
+            harpa=HARPAIntegration(replay_config, session=replayer.session),
+            artifact_store=ArtifactStore(artifact_dir) if config.ARTIFACT_STORE else False)
+        start = time.perf_counter()
+        result = orchestrator.run_task(meta.get("task", ""), task_id, on_event=on_event,
+                                       tenant=meta.get("tenant"), priority=meta.get("priority"))
+        wall = time.perf_counter() - start
+    overhead = max(wall - replayer.waited, 0.0)
+    return {
+        "task_id": task_id,
+        "iterations": len(iterations),
+        "succeeded": result is not None,
+        "result_matches": result == meta.get("result"),
+        "recorded_s": meta.get("seconds", 0.0),
+        "wall_s": wall,
+        "replayed_latency_s": replayer.waited,
+        "overhead_per_iteration_ms": overhead / len(iterations) * 1000 if iterations else 0.0,
+        "model_calls": cassette.count("model"),
+        "grid_calls": cassette.count("grid"),
+        "misses": cassette.misses,
+        "unused": cassette.unused(),
+    }
+
+
+def summarize(reports: list) -> dict:
+    """Totals and medians over many replay reports"""
+    import statistics
+    overheads = [report["overhead_per_iteration_ms"] for report in reports if report["iterations"]]
+    runs = len(reports)
+    return {
+        "runs": runs,
+        "iterations": sum(report["iterations"] for report in reports),
+        "success_rate": sum(report["succeeded"] for report in reports) / runs if runs else 0.0,
+        "result_match_rate": sum(report["result_matches"] for report in reports) / runs if runs else 0.0,
+        "overhead_per_iteration_p50_ms": statistics.median(overheads) if overheads else 0.0,
+        "overhead_per_iteration_max_ms": max(overheads) if overheads else 0.0,
+        "wall_s": sum(report["wall_s"] for report in reports),
+        "misses": sum(report["misses"] for report in reports),
+        "unused": sum(report["unused"] for report in reports),
+    }
+
+
+def replay_paths(paths: list) -> list:
+    """Cassette files from a list of files and directories"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith((".json", ".json.gz")))
+        else:
+            found.append(path)
+    return found
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    parser = argparse.ArgumentParser(description='Replay recorded task runs offline (record with RECORD_DIR)')
+    parser.add_argument('paths', nargs='+', help='Cassette files or directories of them')
+    parser.add_argument('--latency', type=str, default="zero",
+                        help='original | zero | a scale such as 0.5 for the recorded latencies')
+    parser.add_argument('--strict', action='store_true', help='Fail a run on any request not recorded exactly')
+    parser.add_argument('--output', type=str, help='Write per-run reports and the summary as JSON here')
+
+    args = parser.parse_args()
+
+    reports = []
+    for path in replay_paths(args.paths):
+        # Task output is part of the measured path but not of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = replay(Cassette.load(path), args.latency, args.strict)
+        reports.append(dict(report, path=path))
+        print(f"📼 {path}: {report['iterations']} iterations, "
+              f"{'✅' if report['result_matches'] else '❌'} result, "
+              f"{report['overhead_per_iteration_ms']:.2f} ms/iteration overhead, {report['misses']} misses")
+
+    summary = summarize(reports)
+    print(f"📊 {summary['runs']} runs, {summary['iterations']} iterations, "
+          f"results matching {summary['result_match_rate']:.0%}, success {summary['success_rate']:.0%}")
+    print(f"   overhead per iteration p50 / max: {summary['overhead_per_iteration_p50_ms']:.2f} / "
+          f"{summary['overhead_per_iteration_max_ms']:.2f} ms, {summary['misses']} misses")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "runs": reports}, f, indent=2)
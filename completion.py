@@ -0,0 +1,110 @@
+import importlib
+import re
+from config import Config
+from TASK_PROFILES import match_profile
+from model_router import SUCCESS_INDICATORS
+import metrics
+
+ERROR_MARKERS = ("error", "timed out", "cannot connect", "not found", "access denied", "captcha")
+
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "find", "search", "look",
+    "what", "which", "about", "their", "have", "into", "page", "website", "site",
+}
+
+DETECTIONS = metrics.registry.counter("orchestrator_completion_detections_total",
+                                      "Local completion detector decisions", ("decision",))
+
+_WORD = re.compile(r"[a-z0-9$%.]+")
+
+
+class Detection:
+    """Outcome of a completion check"""
+
+    __slots__ = ("complete", "confidence", "reasons")
+
+    def __init__(self, complete: bool, confidence: float, reasons: list):
+        self.complete = complete
+        self.confidence = confidence
+        self.reasons = reasons
+
+    def __repr__(self):
+        return f"Detection(complete={self.complete}, confidence={self.confidence:.2f}, reasons={self.reasons})"
+
+
+def _load_classifier(path: str):
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "predict")
+
+
+class CompletionDetector:
+    """
+    Decides from a HARPA result whether a task is done, without a model call
+
+    The score combines generic success wording (0.4), coverage of the task's
+    content words in the result (up to 0.3) and the matched task profile's
+    ``completion_patterns`` (0.5). Generic signals alone stay below the
+    default threshold, so only profile patterns or an optional classifier
+    can end a task early.
+
+    Args:
+        threshold: Confidence needed to call the task complete
+        classifier: Optional ``predict(task, result) -> probability``; the
+            final confidence is the higher of the rule score and its output
+    """
+
+    def __init__(self, threshold: float = None, classifier=None):
+        self.threshold = Config.COMPLETION_CONFIDENCE if threshold is None else threshold
+        if classifier is None and Config.COMPLETION_CLASSIFIER:
+            classifier = _load_classifier(Config.COMPLETION_CLASSIFIER)
+        self.classifier = classifier
+        self._patterns = {}
+
+    def _profile_patterns(self, name: str, profile: dict) -> list:
+        patterns = self._patterns.get(name)
+        if patterns is None:
+            patterns = [re.compile(pattern, re.IGNORECASE) for pattern in profile.get("completion_patterns", [])]
+            self._patterns[name] = patterns
+        return patterns
+
+    def score(self, task_description: str, result: str) -> tuple:
+        """Return ``(confidence, reasons)`` for a HARPA result"""
+        text = result.lower()
+        if any(marker in text for marker in ERROR_MARKERS):
+            return 0.0, ["error_marker"]
+
+        confidence = 0.0
+        reasons = []
+        if any(indicator in text for indicator in SUCCESS_INDICATORS):
+            confidence += 0.4
+            reasons.append("success_wording")
+
+        task_words = {word for word in _WORD.findall(task_description.lower())
+                      if len(word) > 3 and word not in STOPWORDS}
+        if task_words:
+            result_words = set(_WORD.findall(text))
+            coverage = len(task_words & result_words) / len(task_words)
+            if coverage:
+                confidence += 0.3 * coverage
+                reasons.append(f"coverage={coverage:.2f}")
+
+        matched = match_profile(task_description)
+        if matched:
+            name, profile = matched
+            if any(pattern.search(result) for pattern in self._profile_patterns(name, profile)):
+                confidence += 0.5
+                reasons.append(f"profile:{name}")
+
+        if self.classifier is not None:
+            probability = float(self.classifier(task_description, result))
+            if probability > confidence:
+                reasons.append(f"classifier={probability:.2f}")
+                confidence = probability
+
+        return min(confidence, 1.0), reasons
+
+    def detect(self, task_description: str, result: str) -> Detection:
+        confidence, reasons = self.score(task_description, result)
+        detection = Detection(confidence >= self.threshold, confidence, reasons)
+        DETECTIONS.labels(decision="complete" if detection.complete else "continue").inc()
+        return detection
@@ -1,22 +1,83 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# python-dotenv is comparatively slow to import; skip it when there is no .env
+_ENV_FILES = (".env", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+if any(os.path.isfile(path) for path in _ENV_FILES):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class Config:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "sk-placeholder")
     MAX_TOKENS = 500  # Reduced from default 4096 to prevent quota overuse
     REQUEST_TIMEOUT = 30  # Increased from default 10 seconds
+    TASK_DEADLINE_SECONDS = float(os.getenv("TASK_DEADLINE_SECONDS", "0"))  # Whole-task time limit (0 = none); caps every call's timeout
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # Override for proxies and local mock servers
     AI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")  # Updated to use GPT-4o as intended
+    FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # Cheap model for easy turns
+    MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"  # Route easy turns to FAST_MODEL
+    
+    # Token/cost budgets (0 = unlimited)
+    DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+    TASK_TOKEN_BUDGET = int(os.getenv("TASK_TOKEN_BUDGET", "0"))
+    TASK_COST_BUDGET_USD = float(os.getenv("TASK_COST_BUDGET_USD", "0"))
+    TENANT_COST_BUDGET_USD = float(os.getenv("TENANT_COST_BUDGET_USD", "0"))
+    BUDGET_DOWNSHIFT_RATIO = float(os.getenv("BUDGET_DOWNSHIFT_RATIO", "0.8"))  # Switch to the cheap model past this share
+    BUDGET_DOWNSHIFT_MODEL = os.getenv("BUDGET_DOWNSHIFT_MODEL", "gpt-4o-mini")
+    MODEL_PRICING_PATH = os.getenv("MODEL_PRICING_PATH")  # JSON {"model": [prompt, completion, cached] USD per 1M tokens}
+    
+    # Scheduling across concurrent tasks
+    DEFAULT_PRIORITY = os.getenv("DEFAULT_PRIORITY", "normal")  # interactive, normal or batch for server-submitted tasks
+    TENANT_WEIGHTS_PATH = os.getenv("TENANT_WEIGHTS_PATH")  # JSON {tenant: weight} for fair sharing within a priority class
+    MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))  # Concurrent model calls across tasks (0 = unlimited)
+    GRID_MAX_CONCURRENCY = int(os.getenv("GRID_MAX_CONCURRENCY", "8"))  # Concurrent grid requests across tasks (0 = unlimited)
+    
+    # Local completion detection (ends a task without asking the model)
+    LOCAL_COMPLETION = os.getenv("LOCAL_COMPLETION", "1") == "1"
+    COMPLETION_CONFIDENCE = float(os.getenv("COMPLETION_CONFIDENCE", "0.9"))  # Generic rules alone top out at 0.7
+    COMPLETION_CLASSIFIER = os.getenv("COMPLETION_CLASSIFIER")  # Optional "module:function" returning a probability
     
     # HARPA Configuration - FIXED
     HARPA_API_KEY = os.getenv("HARPA_API_KEY", "harpa-placeholder")  # NEW: API key from HARPA's Automate tab
     HARPA_EXTENSION_PATH = "/path/to/harpa-extension"
     HARPA_EXTENSION_ID = "eanggfilgoajaocelnaflolkadkeghjp"  # CORRECTED: Real HARPA extension ID
-    HARPA_API_URL = "https://api.harpa.ai/api/v1/grid"  # NEW: Actual API endpoint
+    HARPA_API_URL = os.getenv("HARPA_API_URL", "https://api.harpa.ai/api/v1/grid")  # NEW: Actual API endpoint
+    GRID_TIMEOUT = float(os.getenv("GRID_TIMEOUT", "30"))  # Seconds per grid request, capped at the task's time left
+    GRID_MAX_RESPONSE_BYTES = int(os.getenv("GRID_MAX_RESPONSE_BYTES", str(50 * 1024 * 1024)))  # Larger replies are rejected
+    GRID_SPOOL_BYTES = int(os.getenv("GRID_SPOOL_BYTES", str(1024 * 1024)))  # Replies past this are spilled to disk
+    GRID_SPILL_DIR = os.getenv("GRID_SPILL_DIR")  # Where spilled replies go (system temp dir when unset)
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))  # Processes parsing large grid replies (0 = parse in the calling thread)
+    PARSE_OFFLOAD_BYTES = int(os.getenv("PARSE_OFFLOAD_BYTES", str(256 * 1024)))  # Smaller replies are parsed in-thread
+    GRID_COALESCE_LINGER_MS = float(os.getenv("GRID_COALESCE_LINGER_MS", "0"))  # Reuse a finished identical read this long
+    GRID_DOMAIN_CONCURRENCY = int(os.getenv("GRID_DOMAIN_CONCURRENCY", "4"))  # Grid requests in flight per target domain (0 = unlimited)
+    GRID_DOMAIN_INTERVAL_MS = float(os.getenv("GRID_DOMAIN_INTERVAL_MS", "0"))  # Minimum spacing between request starts per domain
+    GRID_DOMAIN_LIMITS_PATH = os.getenv("GRID_DOMAIN_LIMITS_PATH")  # JSON {domain: {max_concurrency, min_interval_ms, crawl_delay}}
+    SITE_REGISTRY_PATH = os.getenv("SITE_REGISTRY_PATH")  # JSON {name: {url, aliases, action, selectors}} merged over built-in sites
+    DEFAULT_SITE_URL = os.getenv("DEFAULT_SITE_URL", "https://www.google.com")  # Used when a command names no site or URL
+    RESULT_EXTRACTION = os.getenv("RESULT_EXTRACTION", "1") == "1"  # Condense page results before prompting
+    RESULT_TOKEN_BUDGET = int(os.getenv("RESULT_TOKEN_BUDGET", "1500"))  # Max tokens kept per result (0 = no cap)
     
     # Application Settings
     PERSISTENT_DIR = "persistent_data"
+    STATE_FORMAT = os.getenv("STATE_FORMAT", "json-compact")  # json, json-compact or msgpack
+    STATE_COMPRESSION = os.getenv("STATE_COMPRESSION", "none")  # none, gzip or zstd
+    ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "1") == "1"  # Keep HARPA results and raw grid responses as content-addressed blobs
+    ARTIFACT_DIR = os.getenv("ARTIFACT_DIR")  # Defaults to <PERSISTENT_DIR>/artifacts
+    ARTIFACT_COMPRESSION = os.getenv("ARTIFACT_COMPRESSION", "gzip")  # none, gzip or zstd
     MAX_REQUESTS_PER_MINUTE = 3  # Prevent rate limiting
-    RETRY_ATTEMPTS = 2  # Auto-retry on failures
\ No newline at end of file
+    RETRY_ATTEMPTS = 2  # Auto-retry on failures
+    SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "8765"))
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))  # Tasks run concurrently by --serve
+    RUN_MANY_WORKERS = int(os.getenv("RUN_MANY_WORKERS", "8"))  # Default threads for Orchestrator.run_many
+    SERVER_MAX_JOBS = int(os.getenv("SERVER_MAX_JOBS", "1000"))  # Jobs tracked (finished ones are evicted first; beyond that POST /tasks gets 503)
+    SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "0") == "1"
+    TRACE_DIR = os.getenv("TRACE_DIR")  # Per-task OTLP trace + timing summary files (off when unset)
+    RECORD_DIR = os.getenv("RECORD_DIR")  # Per-task model/grid cassettes for offline replay (off when unset)
+    OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")  # Optional OTLP/HTTP collector for traces
+    METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")  # Prometheus textfile written when the CLI exits
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # --debug overrides to DEBUG
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json (one object per line)
+    LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))  # Cap for logged payloads and results
+    LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", "1.0"))  # Fraction of payload dumps kept
+    STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "150"))  # Target for `orchestrator.py --help`
\ No newline at end of file
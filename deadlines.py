@@ -0,0 +1,211 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# How often blocking waits wake up to notice a cancel_event being set
+POLL_SECONDS = 0.1
+
+
+class TaskInterrupted(BaseException):
+    """
+    Base for stopping a task from inside any call it makes
+
+    Like ``asyncio.CancelledError`` this is a ``BaseException``, so the
+    ``except Exception`` recovery code around grid and model calls lets it
+    through instead of retrying or falling back.
+    """
+
+
+class TaskCancelled(TaskInterrupted):
+    """Raised when the task's cancel_event has been set"""
+
+
+class DeadlineExceeded(TaskInterrupted):
+    """Raised when the task has run out of time"""
+
+
+class Deadline:
+    """
+    Time budget and cancellation signal for one task
+
+    Args:
+        seconds: Time the task may take from now; None for no limit
+        cancel_event: Optional threading.Event that cancels the task when set
+    """
+
+    def __init__(self, seconds: float = None, cancel_event=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.cancel_event = cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def remaining(self):
+        """Seconds left, or None without a time limit"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise ``TaskCancelled`` or ``DeadlineExceeded`` if the task should stop"""
+        if self.cancelled:
+            raise TaskCancelled("task cancelled")
+        if self.expired:
+            raise DeadlineExceeded("task deadline exceeded")
+
+    def timeout(self, default: float) -> float:
+        """``default`` capped at the time left; raises if none is left"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def poll_timeout(self, timeout: float = None):
+        """
+        How long a blocking wait may sleep before checking this deadline again
+
+        Returns ``timeout`` when nothing can interrupt the wait sooner.
+        """
+        limits = [value for value in (timeout, self.remaining()) if value is not None]
+        if self.cancel_event is not None:
+            limits.append(POLL_SECONDS)
+        return min(limits) if limits else None
+
+
+_NO_DEADLINE = Deadline()
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    """Make ``deadline`` apply to every call made inside the block"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Deadline:
+    """The running task's deadline; one that never expires outside a task"""
+    return _current.get() or _NO_DEADLINE
+
+
+class _Watcher:
+    """One thread that calls ``abort`` for watched calls whose task has stopped"""
+
+    def __init__(self):
+        self._calls = {}
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    @contextmanager
+    def watch(self, deadline: Deadline, abort):
+        key = object()
+        with self._wakeup:
+            self._calls[key] = (deadline, abort)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deadline-watcher", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        try:
+            yield
+        finally:
+            with self._wakeup:
+                self._calls.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._calls:
+                    self._wakeup.wait()
+                # Every watched deadline has a time limit or a cancel_event to poll
+                wait = min(deadline.poll_timeout() for deadline, _ in self._calls.values())
+                self._wakeup.wait(max(wait, POLL_SECONDS / 10))
+                calls = list(self._calls.values())
+            for deadline, abort in calls:
+                if deadline.cancelled or deadline.expired:
+                    # Repeated every poll until the call returns, in case its socket did not exist yet
+                    try:
+                        abort()
+                    except Exception:
+                        pass
+
+
+_watcher = _Watcher()
+
+
+def abortable(fn, abort):
+    """
+    Return ``fn()``, calling ``abort()`` from a watcher thread once the running task is cancelled or late
+
+    ``abort`` should make the blocking call in ``fn`` fail at once, e.g. by
+    shutting down its socket, so the call unwinds in the task's own thread
+    and releases its slots and spans on the way. An error ``fn`` raises
+    after the task has stopped becomes ``TaskInterrupted``. Without a
+    deadline or cancel_event this is just ``fn()``.
+    """
+    deadline = current_deadline()
+    if deadline.expires_at is None and deadline.cancel_event is None:
+        return fn()
+    with _watcher.watch(deadline, abort):
+        try:
+            return fn()
+        except Exception as e:
+            try:
+                deadline.check()
+            except TaskInterrupted as interrupted:
+                raise interrupted from e
+            raise
+
+
+def interruptible(fn, cleanup=None):
+    """
+    Return ``fn()``, but stop waiting for it once the running task is cancelled or late
+
+    For blocking calls that ``abortable`` cannot reach: ``fn`` runs in a
+    helper thread under the same deadline while the task raises
+    ``TaskInterrupted`` right away. The helper keeps running until ``fn``
+    returns, so ``fn`` should be the bare network call; take slots and
+    open spans around ``interruptible`` instead. If the task has given up,
+    ``cleanup(result)`` receives whatever ``fn`` eventually returns.
+    Without a deadline or cancel_event this is just ``fn()``.
+    """
+    deadline = current_deadline()
+    if deadline.expires_at is None and deadline.cancel_event is None:
+        return fn()
+
+    done = threading.Event()
+    lock = threading.Lock()
+    outcome = {}
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            outcome["result"] = context.run(fn)
+        except BaseException as e:
+            outcome["error"] = e
+        with lock:
+            done.set()
+            abandoned = outcome.get("abandoned")
+        if abandoned and "result" in outcome and cleanup is not None:
+            cleanup(outcome["result"])
+
+    threading.Thread(target=run, name="interruptible", daemon=True).start()
+    while not done.wait(deadline.poll_timeout()):
+        try:
+            deadline.check()
+        except TaskInterrupted:
+            with lock:
+                if not done.is_set():
+                    outcome["abandoned"] = True
+                    raise
+            break
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
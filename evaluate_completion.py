@@ -0,0 +1,90 @@
+import argparse
+import json
+from config import Config
+from completion import CompletionDetector
+from state_manager import list_task_ids, load_state
+from accounting import TENANT_PREFIX
+from artifact_store import ArtifactStore, step_result
+
+
+def examples_from_states() -> list:
+    """
+    Label recorded progress steps from persisted task state
+
+    A step is positive when it is the last step of a task the model marked
+    complete, i.e. the model answered [TASK_COMPLETE] right after seeing it.
+    Tasks finished by the detector itself are skipped.
+    """
+    examples = []
+    store = ArtifactStore()
+    for task_id in list_task_ids():
+        if task_id.startswith(TENANT_PREFIX):
+            continue
+        state = load_state(task_id)
+        if state.get("completed_by") == "detector":
+            continue
+        progress = state.get("progress") or []
+        completed = state.get("status") == "completed"
+        for index, step in enumerate(progress):
+            examples.append({
+                "task_id": task_id,
+                "task": state.get("task", ""),
+                "result": step_result(step, store),
+                "complete": completed and index == len(progress) - 1,
+            })
+    return examples
+
+
+def examples_from_jsonl(path: str) -> list:
+    """Read hand-labelled ``{"task", "result", "complete"}`` lines"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(examples: list, thresholds: list, detector: CompletionDetector = None) -> list:
+    """Precision, recall and early-stop rate of the detector at each threshold"""
+    detector = detector or CompletionDetector()
+    scored = [(detector.score(example["task"], example["result"])[0], bool(example["complete"]))
+              for example in examples]
+    rows = []
+    for threshold in thresholds:
+        tp = sum(1 for score, label in scored if score >= threshold and label)
+        fp = sum(1 for score, label in scored if score >= threshold and not label)
+        fn = sum(1 for score, label in scored if score < threshold and label)
+        rows.append({
+            "threshold": threshold,
+            "true_positives": tp,
+            "false_positives": fp,
+            "false_negatives": fn,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "recall": tp / (tp + fn) if tp + fn else None,
+        })
+    return rows
+
+
+def _percent(value) -> str:
+    return "   -  " if value is None else f"{value * 100:5.1f}%"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure completion detector precision against recorded runs')
+    parser.add_argument('--labels', type=str, help='JSONL file of labelled examples instead of persisted state')
+    parser.add_argument('--dir', type=str, default=Config.PERSISTENT_DIR, help='State directory')
+    parser.add_argument('--thresholds', type=str, default="0.5,0.7,0.8,0.9,0.95", help='Comma-separated thresholds')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+    Config.PERSISTENT_DIR = args.dir
+
+    examples = examples_from_jsonl(args.labels) if args.labels else examples_from_states()
+    positives = sum(1 for example in examples if example["complete"])
+    rows = evaluate(examples, [float(value) for value in args.thresholds.split(",")])
+
+    if args.json:
+        print(json.dumps({"examples": len(examples), "positives": positives, "thresholds": rows}, indent=2))
+    else:
+        print(f"📊 {len(examples)} examples, {positives} complete")
+        print(f"{'threshold':>9} {'precision':>9} {'recall':>7} {'tp':>5} {'fp':>5} {'fn':>5}")
+        for row in rows:
+            print(f"{row['threshold']:>9.2f} {_percent(row['precision']):>9} {_percent(row['recall']):>7} "
+                  f"{row['true_positives']:>5} {row['false_positives']:>5} {row['false_negatives']:>5}")
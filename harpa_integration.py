@@ -1,18 +1,383 @@
-import requests
-from playwright.sync_api import sync_playwright
 from config import Config
-import time
+from tracing import tracer
+from log_utils import get_logger, LazyJSON, Truncated
+from result_extraction import summarize_result, take_chars
+from response_stream import ResponseTooLarge, SpooledBody
+from singleflight import SingleFlight
+from site_registry import get_registry
+from politeness import domain_of, get_scheduler
+from scheduling import get_limiter
+from deadlines import TaskInterrupted, abortable, current_deadline
+from parse_pool import get_parse_pool
+from cassette import RecordingSession, is_recording
+from artifact_store import current_store
+import metrics
+import contextvars
 import json
+import re
+import socket
+import threading
+import time
+
+# requests is imported inside the methods that use it so importing this
+# module (and the orchestrator) stays cheap for --help and health checks
+URL_PATTERN = re.compile(r'https?://[^\s]+')
+SERP_DOMAIN = "google.com"  # HARPA's serp action queries Google
+
+logger = get_logger("harpa")
+
+# Shared by every HARPAIntegration so concurrent tasks collapse identical reads
+_flights = SingleFlight(Config.GRID_COALESCE_LINGER_MS / 1000)
+
+class GridText(str):
+    """
+    Condensed result text, as handed to the model, plus where the raw response went
+
+    ``raw_artifact`` is the ``{"digest", "size"}`` of the undecoded body in
+    the running task's artifact store (not yet referenced; see
+    ``ArtifactStore.retain``), or None when there is no store. String
+    operations return plain ``str``.
+    """
+
+    __slots__ = ("raw_artifact",)
+
+    def __new__(cls, text: str, raw_artifact: dict = None):
+        self = super().__new__(cls, text)
+        self.raw_artifact = raw_artifact
+        return self
+
+
+class _InFlight:
+    """The pooled connection a grid request is using, so a stopped task can shut it down"""
 
-class HARPAIntegration:
     def __init__(self):
-        self.api_key = Config.HARPA_API_KEY
-        self.api_url = "https://api.harpa.ai/api/v1/grid"
+        self.conn = None
+        self.response = None
+        self.lock = threading.Lock()
+
+    def attach(self, response):
+        """Also reach the socket through ``response``, which may own it once the headers are in"""
+        with self.lock:
+            if self.conn is not None:
+                self.response = response
+
+    def abort(self):
+        # Fails the blocked send or read in the task's thread, which then unwinds normally
+        with self.lock:
+            shutdown = getattr(self.response, "shutdown", None)  # urllib3 >= 2.3
+            if shutdown is not None:
+                shutdown()
+                return
+            sock = getattr(self.conn, "sock", None)
+            if sock is not None:
+                sock.shutdown(socket.SHUT_RDWR)
+
+
+_in_flight = contextvars.ContextVar("grid_in_flight", default=None)
+
+
+def _track_connections(session):
+    """Have ``session``'s connection pools note the connection each grid request holds in ``_in_flight``"""
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class Tracked:
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            in_flight = _in_flight.get()
+            if in_flight is not None:
+                with in_flight.lock:
+                    in_flight.conn = conn
+            return conn
+
+        def _put_conn(self, conn):
+            # Forget the connection before another request can take it from the pool
+            in_flight = _in_flight.get()
+            if in_flight is not None:
+                with in_flight.lock:
+                    in_flight.conn = in_flight.response = None
+            super()._put_conn(conn)
+
+    pools = {"http": type("TrackedHTTPConnectionPool", (Tracked, HTTPConnectionPool), {}),
+             "https": type("TrackedHTTPSConnectionPool", (Tracked, HTTPSConnectionPool), {})}
+    for adapter in session.adapters.values():
+        adapter.poolmanager.pool_classes_by_scheme = pools
+
+
+def _until(deadline, chunks):
+    """Pass chunks through, stopping the download once ``deadline`` says so"""
+    for chunk in chunks:
+        deadline.check()
+        yield chunk
+
+
+class HARPAIntegration:
+    """
+    Client for the HARPA grid API
+
+    Args:
+        config: Configuration object, defaults to ``Config``
+        session: requests-compatible session to send through instead of a
+            pooled ``requests.Session`` (e.g. a cassette replayer)
+    """
+
+    def __init__(self, config=Config, session=None):
+        self.config = config
+        self.api_key = config.HARPA_API_KEY
+        self.api_url = config.HARPA_API_URL
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-    
+        self._session = session
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Pooled HTTP session, created on first use and reused across calls and threads"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    _track_connections(session)
+                    # With RECORD_DIR set, requests made by recorded tasks go into their cassettes
+                    self._session = RecordingSession(session) if self.config.RECORD_DIR else session
+        return self._session
+
+    def _post(self, payload: dict, timeout: float = None):
+        """
+        Send one request to the grid, timed as a ``grid.request`` span
+
+        The request first waits for a slot on its target domain (see
+        ``politeness.DomainScheduler``), then for a shared grid slot handed
+        out by task priority; neither wait is part of the latency metrics.
+        The body is streamed into a ``SpooledBody`` (spilled to disk past
+        ``GRID_SPOOL_BYTES``) and capped at ``GRID_MAX_RESPONSE_BYTES``.
+
+        ``timeout`` (default ``GRID_TIMEOUT``) is capped at the time the
+        running task has left, and both the slot waits and the body stream
+        stop with ``TaskInterrupted`` once the task is cancelled or late. A
+        request still waiting on the network then has its socket shut down,
+        so it never holds its slots past that point.
+
+        Returns:
+            ``(response, body)``; the caller must ``close()`` the body
+        """
+        action = payload.get("action")
+        domain = domain_of(payload["url"]) if payload.get("url") else SERP_DOMAIN
+        with get_scheduler().slot(domain) as domain_wait, get_limiter("grid").slot() as grid_wait:
+            waited = domain_wait + grid_wait
+            deadline = current_deadline()
+            timeout = deadline.timeout(timeout or self.config.GRID_TIMEOUT)
+            # HARPA gives up on the page when we stop waiting for it
+            body = json.dumps(dict(payload, timeout=int(timeout * 1000)))
+            start = time.perf_counter()
+            outcome = "error"
+
+            def download():
+                nonlocal outcome
+                with self.session.post(self.api_url, data=body, timeout=timeout, stream=True) as response:
+                    in_flight.attach(getattr(response, "raw", None))
+                    max_bytes = self.config.GRID_MAX_RESPONSE_BYTES
+                    declared = int(response.headers.get("Content-Length") or 0)
+                    if max_bytes and declared > max_bytes:
+                        outcome = "too_large"
+                        raise ResponseTooLarge(f"Grid response of {declared} bytes exceeds {max_bytes} bytes")
+                    try:
+                        content = SpooledBody.read(_until(deadline, response.iter_content(chunk_size=65536)),
+                                                   max_bytes, self.config.GRID_SPOOL_BYTES,
+                                                   self.config.GRID_SPILL_DIR)
+                    except ResponseTooLarge:
+                        outcome = "too_large"
+                        raise
+                return response, content
+
+            in_flight = _InFlight()
+            token = _in_flight.set(in_flight)
+            try:
+                with tracer.span("grid.request", action=action, url=payload.get("url", ""), domain=domain,
+                                 queue_seconds=round(waited, 4), request_bytes=len(body)) as span:
+                    response, content = abortable(download, in_flight.abort)
+                    span.set_attributes(status_code=response.status_code, response_bytes=content.size,
+                                        spilled=not content.in_memory)
+                    outcome = "ok" if response.status_code == 200 else f"http_{response.status_code}"
+                    return response, content
+            except TaskInterrupted:
+                outcome = "interrupted"
+                raise
+            finally:
+                _in_flight.reset(token)
+                metrics.GRID_CALLS.labels(action=action, outcome=outcome).inc()
+                metrics.GRID_SECONDS.labels(action=action).observe(time.perf_counter() - start)
+
+    def _receive(self, payload: dict, timeout: float = None) -> tuple:
+        """
+        ``(status_code, body, error, elapsed_ms)`` for one grid request
+
+        For non-200 replies ``error`` holds the start of the response body and
+        ``body`` is already closed; otherwise the caller must close ``body``.
+        """
+        start = time.perf_counter()
+        response, content = self._post(payload, timeout=timeout)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        logger.debug("Response Status: %s", response.status_code)
+        logger.debug("Response Headers: %s", Truncated(response.headers), extra={"verbose": True})
+        if response.status_code != 200:
+            with content.open_text() as f:
+                error = f.read(self.config.LOG_MAX_CHARS or None)
+            content.close()
+            logger.warning("HTTP Error Response: %s", Truncated(error))
+            return response.status_code, content, error, elapsed_ms
+        return response.status_code, content, None, elapsed_ms
+
+    def _request(self, payload: dict, reply_type, timeout: float = None):
+        """POST ``payload`` and validate the response body into ``reply_type``"""
+        status_code, content, error, elapsed_ms = self._receive(payload, timeout)
+        if error is not None:
+            return reply_type.model_construct(error=error, status_code=status_code,
+                                              elapsed_ms=elapsed_ms, response_bytes=content.size)
+        return self._reply(content, reply_type, status_code, elapsed_ms)
+
+    def _reply(self, content, reply_type, status_code: int, elapsed_ms: float):
+        """Typed reply for a 200 body; spilled bodies stay on disk until ``release()``"""
+        if content.in_memory:
+            reply = reply_type.parse(content.getvalue(), status_code, elapsed_ms)
+            content.close()
+            logger.debug("Full API Response: %s", LazyJSON(reply.content()), extra={"verbose": True})
+        else:
+            # Long strings (e.g. a command's message) are read no further than spilled results are
+            reply = reply_type.from_spill(content, status_code, elapsed_ms, max_chars=self.config.GRID_SPOOL_BYTES)
+            logger.info("💾 Large grid response (%d bytes) spilled to %s", content.size, content.path)
+        return reply
+
+    def _request_text(self, payload: dict, reply_type, timeout: float = None) -> tuple:
+        """
+        ``(ok, status_code, text)`` for callers that only need the condensed text
+
+        Large in-memory bodies are parsed and condensed by the parse pool
+        straight from the response buffer, off this thread. ``text`` is
+        the error body for non-200 replies and otherwise a ``GridText``
+        whose ``raw_artifact`` locates the response body in the task's store.
+        """
+        status_code, content, error, elapsed_ms = self._receive(payload, timeout)
+        if error is not None:
+            return False, status_code, error
+        # The artifact store keeps the undecoded body; only the condensed text reaches the model
+        raw_artifact = self._store_body(content)
+
+        pool = get_parse_pool()
+        if content.in_memory and pool.offloads(content.size):
+            try:
+                with content.getbuffer() as body:
+                    ok, text = pool.summarize(body, reply_type)
+            finally:
+                content.close()
+            return ok, status_code, GridText(text, raw_artifact)
+
+        reply = self._reply(content, reply_type, status_code, elapsed_ms)
+        return reply.ok, status_code, GridText(self._consume(reply), raw_artifact)
+
+    def _store_body(self, content):
+        """
+        Stream a response body into the running task's artifact store
+
+        Returns:
+            ``{"digest", "size"}``, or None outside a task with a store or
+            if the body could not be stored
+        """
+        store = current_store()
+        if store is None:
+            return None
+        try:
+            if content.in_memory:
+                with content.getbuffer() as body:
+                    return store.put_stream([body], content.size)
+            with open(content.path, "rb") as f:
+                return store.put_stream(iter(lambda: f.read(65536), b""), content.size)
+        except Exception as e:
+            logger.warning("⚠️ Could not store raw grid response: %s", e)
+            return None
+
+    def text(self, reply) -> str:
+        """Condensed text of a successful reply, as handed to the model"""
+        if reply.spill_path is None:
+            return summarize_result(reply.content(), raw_chars=reply.response_bytes)
+        # Only read as many spilled items as fit in the in-memory threshold
+        items = take_chars(reply.iter_results(), self.config.GRID_SPOOL_BYTES)
+        return summarize_result(items or reply.content(), raw_chars=reply.response_bytes)
+
+    def _consume(self, reply) -> str:
+        """``text(reply)``, then delete any spilled body"""
+        try:
+            return self.text(reply)
+        finally:
+            reply.release()
+
+    def command(self, command: str, url: str = None):
+        """
+        Run a natural language command and return the typed ``CommandReply``
+
+        Args:
+            command: Natural language command from GPT-4o
+            url: Target URL for the action (optional)
+        """
+        from harpa_models import CommandReply
+        return self._request(self._command_payload(command, url), CommandReply)
+
+    def _command_payload(self, command: str, url: str = None) -> dict:
+        # Parse URL from command if not provided
+        if not url:
+            url, _ = get_registry().resolve(command, URL_PATTERN)
+
+        # Prepare the CORRECTED payload for HARPA API
+        payload = {
+            "action": "command",  # Changed from "prompt" to "command"
+            "url": url,
+            "name": "Custom Command",  # Required for command action
+            "inputs": [command],  # Pass command as input
+            "resultParam": "message",  # Get the result message
+            "node": "default"  # Use default node
+        }
+
+        logger.debug("Sending payload to HARPA API: %s", LazyJSON(payload), extra={"verbose": True})
+        return payload
+
+    def scrape(self, url: str, selector=None):
+        """
+        Run HARPA's scrape action and return the typed ``ScrapeReply``
+
+        Args:
+            url: Page to scrape
+            selector: CSS selector, or ``{label: selector}`` to grab several fields
+        """
+        from harpa_models import ScrapeReply
+        return self._request(self._scrape_payload(url, selector), ScrapeReply)
+
+    def _scrape_payload(self, url: str, selector=None) -> dict:
+        payload = {
+            "action": "scrape",
+            "url": url
+        }
+
+        # Add specific selectors if provided
+        if selector:
+            selectors = selector if isinstance(selector, dict) else {"scraped_data": selector}
+            payload["grab"] = [{
+                "selector": css,
+                "selectorType": "css",
+                "at": "all",
+                "take": "innerText",
+                "label": label
+            } for label, css in selectors.items()]
+        return payload
+
+    def serp(self, query: str):
+        """Run HARPA's serp action and return the typed ``SerpReply``"""
+        from harpa_models import SerpReply
+        return self._request({"action": "serp", "query": query}, SerpReply)
+
     def execute_harpa_command(self, command: str, url: str = None) -> str:
         """
         Execute a command through HARPA's corrected API
@@ -21,67 +386,14 @@ class HARPAIntegration:
             command: Natural language command from GPT-4o
             url: Target URL for the action (optional)
         """
+        import requests
+        from harpa_models import CommandReply
+
         try:
-            # Parse URL from command if not provided
-            if not url:
-                # Extract URL from common patterns
-                import re
-                url_pattern = r'https?://[^\s]+'
-                urls = re.findall(url_pattern, command)
-                if urls:
-                    url = urls[0]
-                elif "binance" in command.lower():
-                    url = "https://www.binance.com"
-                elif "google" in command.lower():
-                    url = "https://www.google.com"
-                else:
-                    url = "https://www.google.com"  # Default fallback
-            
-            # Prepare the CORRECTED payload for HARPA API
-            payload = {
-                "action": "command",  # Changed from "prompt" to "command"
-                "url": url,
-                "name": "Custom Command",  # Required for command action
-                "inputs": [command],  # Pass command as input
-                "resultParam": "message",  # Get the result message
-                "timeout": 30000,
-                "node": "default"  # Use default node
-            }
-            
-            print(f"Sending CORRECTED payload to HARPA API: {json.dumps(payload, indent=2)}")
-            
-            # Make the API request
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=self.headers,
-                timeout=30
-            )
-            
-            print(f"Response Status: {response.status_code}")
-            print(f"Response Headers: {dict(response.headers)}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"Full API Response: {json.dumps(result, indent=2)}")
-                
-                # Handle different response formats
-                if isinstance(result, dict):
-                    if "results" in result:
-                        return str(result["results"])
-                    elif "message" in result:
-                        return result["message"]
-                    elif "data" in result:
-                        return str(result["data"])
-                    else:
-                        return str(result)
-                else:
-                    return str(result)
-                    
-            else:
-                error_text = response.text
-                print(f"HTTP Error Response: {error_text}")
-                return f"HTTP Error {response.status_code}: {error_text}"
+            _, status_code, text = self._request_text(self._command_payload(command, url), CommandReply)
+            if status_code != 200:
+                return f"HTTP Error {status_code}: {text}"
+            return text
                 
         except requests.exceptions.Timeout:
             return "HARPA API request timed out. The service might be busy or your node might be offline."
@@ -90,38 +402,48 @@ class HARPAIntegration:
         except Exception as e:
             return f"Integration Error: {str(e)}"
     
-    def scrape_page(self, url: str, selector: str = None) -> str:
+    def _shared(self, key: tuple, request) -> tuple:
+        """
+        ``(ok, status_code, text)`` for a read-only grid request
+
+        Identical requests already in flight (from any task in this process)
+        are not sent again; their result is shared. ``request`` returns the
+        same tuple, e.g. from ``_request_text``. Tasks being recorded always
+        send their own request, so each cassette holds every grid read its
+        task made.
+        """
+        if is_recording():
+            return request()
+        try:
+            result, shared = _flights.do((self.api_url,) + key, request)
+        except TaskInterrupted:
+            # Only our own task's cancellation stops us; if it was the task
+            # that sent the shared request, send it again ourselves
+            current_deadline().check()
+            result, shared = _flights.do((self.api_url,) + key, request)
+        if shared:
+            metrics.GRID_COALESCED.labels(action=key[0]).inc()
+        return result
+
+    def _scrape(self, url: str, selector=None) -> tuple:
+        from harpa_models import ScrapeReply
+        key = tuple(sorted(selector.items())) if isinstance(selector, dict) else selector
+        return self._shared(("scrape", url, key),
+                            lambda: self._request_text(self._scrape_payload(url, selector), ScrapeReply))
+
+    def _search(self, query: str) -> tuple:
+        from harpa_models import SerpReply
+        return self._shared(("serp", query), lambda: self._request_text({"action": "serp", "query": query}, SerpReply))
+
+    def scrape_page(self, url: str, selector=None) -> str:
         """
         Use HARPA's scrape action to extract data from a webpage
         """
         try:
-            payload = {
-                "action": "scrape",
-                "url": url,
-                "timeout": 30000
-            }
-            
-            # Add specific selector if provided
-            if selector:
-                payload["grab"] = [{
-                    "selector": selector,
-                    "selectorType": "css",
-                    "at": "all",
-                    "take": "innerText",
-                    "label": "scraped_data"
-                }]
-            
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=self.headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return str(response.json())
-            else:
-                return f"Scrape Error {response.status_code}: {response.text}"
+            _, status_code, text = self._scrape(url, selector)
+            if status_code != 200:
+                return f"Scrape Error {status_code}: {text}"
+            return text
                 
         except Exception as e:
             return f"Scrape Error: {str(e)}"
@@ -131,52 +453,77 @@ class HARPAIntegration:
         Use HARPA's serp action to search the web
         """
         try:
-            payload = {
-                "action": "serp",
-                "query": query,
-                "timeout": 30000
-            }
-            
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=self.headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return str(response.json())
-            else:
-                return f"Search Error {response.status_code}: {response.text}"
+            _, status_code, text = self._search(query)
+            if status_code != 200:
+                return f"Search Error {status_code}: {text}"
+            return text
                 
         except Exception as e:
             return f"Search Error: {str(e)}"
 
+_default_harpa = None
+_default_harpa_lock = threading.Lock()
+
+
+def get_harpa() -> HARPAIntegration:
+    """Return the process-wide HARPAIntegration so its connection pool is shared"""
+    global _default_harpa
+    if _default_harpa is None:
+        with _default_harpa_lock:
+            if _default_harpa is None:
+                _default_harpa = HARPAIntegration()
+    return _default_harpa
+
+
+def _fallback_text(action, *args):
+    """Run a shared grid read, returning its text only if it succeeded"""
+    try:
+        ok, _, text = action(*args)
+    except Exception as e:
+        logger.debug("Fallback failed: %s", e)
+        return None
+    return text if ok else None
+
+
 # Backward compatibility function with improved error handling
-def execute_harpa(command: str) -> str:
+def execute_harpa(command: str, harpa: HARPAIntegration = None) -> str:
     """
     Main function with fallback strategies
+
+    Grid results come back as ``GridText``, pointing at the raw response
+    body in the task's artifact store; error messages are plain strings.
+
+    Args:
+        command: Natural language command to execute
+        harpa: Integration to use, defaults to the shared instance
     """
-    harpa = HARPAIntegration()
+    harpa = harpa or get_harpa()
     
     # Try the command action first
     result = harpa.execute_harpa_command(command)
     
     # If command fails, try alternative approaches
     if "Error" in result or "timeout" in result.lower():
-        print("🔄 Command failed, trying alternative approaches...")
+        logger.info("🔄 Command failed, trying alternative approaches...")
         
         # Try web search if command mentions searching
         if any(word in command.lower() for word in ['search', 'find', 'look', 'price']):
             search_query = command.replace('Go to', '').replace('go to', '').strip()
-            search_result = harpa.search_web(search_query)
-            if not "Error" in search_result:
-                return f"Search result: {search_result}"
+            with tracer.span("harpa.fallback", strategy="search") as span:
+                text = _fallback_text(harpa._search, search_query)
+                span.set_attribute("succeeded", text is not None)
+            metrics.FALLBACKS.labels(strategy="search", outcome="ok" if text is not None else "error").inc()
+            if text is not None:
+                return GridText(f"Search result: {text}", text.raw_artifact)
         
-        # Try direct scraping if URL is mentioned
-        if 'binance' in command.lower():
-            scrape_result = harpa.scrape_page("https://www.binance.com")
-            if not "Error" in scrape_result:
-                return f"Scraped content: {scrape_result}"
+        # Try direct scraping if the command names a site that is best scraped
+        _, site = get_registry().resolve(command, URL_PATTERN)
+        if site and site.action == "scrape":
+            with tracer.span("harpa.fallback", strategy="scrape", site=site.name) as span:
+                text = _fallback_text(harpa._scrape, site.url, site.selectors or None)
+                span.set_attribute("succeeded", text is not None)
+            metrics.FALLBACKS.labels(strategy="scrape", outcome="ok" if text is not None else "error").inc()
+            if text is not None:
+                return GridText(f"Scraped content: {text}", text.raw_artifact)
     
     return result
\ No newline at end of file
@@ -0,0 +1,154 @@
+import json
+import os
+from typing import Any, ClassVar, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from response_stream import iter_members
+
+# pydantic is slow to import; harpa_integration imports this module lazily
+
+
+class GridReply(BaseModel):
+    """
+    Common fields of a HARPA grid reply
+
+    Unknown fields are kept (``extra="allow"``) so nothing the grid sends is
+    lost. ``status_code``, ``elapsed_ms`` and ``response_bytes`` are filled
+    in by the client. Replies too large to keep in memory have
+    ``spill_path`` set instead of ``results``; stream them with
+    ``iter_results()`` and call ``release()`` when done.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    status: Optional[str] = None
+    url: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    results: Any = None
+    data: Any = None
+    status_code: int = 200
+    elapsed_ms: float = 0.0
+    response_bytes: int = 0
+    spill_path: Optional[str] = None
+
+    _item_type: ClassVar[Any] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200 and self.error is None and (self.status or "ok").lower() in ("ok", "success")
+
+    def content(self):
+        """The reply's payload: ``results``, else ``message``, else ``data``, else all fields"""
+        for value in (self.results, self.message, self.data):
+            if value is not None:
+                return value
+        return self.model_dump(exclude={"status_code", "elapsed_ms", "response_bytes", "spill_path"}, exclude_none=True)
+
+    @classmethod
+    def parse(cls, body: bytes, status_code: int = 200, elapsed_ms: float = 0.0):
+        """
+        Validate a raw response body straight from JSON bytes
+
+        Objects that do not match the model are kept unvalidated, other JSON
+        values (e.g. a bare list) become ``results`` and non-JSON bodies
+        become ``message``.
+        """
+        try:
+            reply = cls.model_validate_json(body)
+        except ValidationError:
+            try:
+                value = json.loads(body)
+            except ValueError:
+                reply = GridReply(message=body.decode("utf-8", "replace"))
+            else:
+                reply = GridReply.model_construct(**value) if isinstance(value, dict) else GridReply(results=value)
+        reply.status_code = status_code
+        reply.elapsed_ms = elapsed_ms
+        reply.response_bytes = len(body)
+        return reply
+
+    @classmethod
+    def from_spill(cls, body, status_code: int = 200, elapsed_ms: float = 0.0, max_chars: int = None):
+        """
+        Build a reply for a body spilled to disk without loading ``results``
+
+        Other top-level fields are read in one streaming pass; result items
+        are skipped and later streamed by ``iter_results()``. String fields
+        such as ``message`` are cut to ``max_chars`` while reading, so a
+        reply whose bulk is one long string is not loaded whole either.
+        """
+        with body.open_text() as f:
+            fields = {key: value for key, value, is_item in iter_members(f, max_chars=max_chars) if not is_item}
+        known = {name: value for name, value in fields.items() if name in cls.model_fields and name != "results"}
+        return cls.model_construct(**known, status_code=status_code, elapsed_ms=elapsed_ms,
+                                   response_bytes=body.size, spill_path=body.path)
+
+    def iter_results(self):
+        """Yield result items, streaming them from ``spill_path`` when spilled"""
+        if self.spill_path is None:
+            results = self.results
+            yield from results if isinstance(results, list) else ([] if results is None else [results])
+            return
+        with open(self.spill_path, encoding="utf-8") as f:
+            # Other members were read by from_spill(); pass over long strings without keeping them
+            for _, item, is_item in iter_members(f, max_chars=1):
+                if is_item:
+                    yield self._item_type.model_validate(item) if self._item_type else item
+
+    def release(self):
+        """Delete the spilled body, if any"""
+        if self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except FileNotFoundError:
+                pass
+            self.spill_path = None
+
+
+class CommandReply(GridReply):
+    """Reply to a ``command`` action"""
+
+
+class GrabbedField(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    label: Optional[str] = None
+    value: Any = None
+
+
+class ScrapeReply(GridReply):
+    """Reply to a ``scrape`` action; ``results`` holds the grabbed fields"""
+
+    @property
+    def grabbed(self) -> Dict[str, Any]:
+        """Grabbed values by label (``results`` as a dict or a list of label/value items)"""
+        if isinstance(self.results, dict):
+            return self.results
+        fields = {}
+        if isinstance(self.results, list):
+            for index, item in enumerate(self.results):
+                if isinstance(item, dict) and "value" in item:
+                    field = GrabbedField.model_validate(item)
+                    fields[field.label or f"field_{index}"] = field.value
+        return fields
+
+
+class SerpResult(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    title: Optional[str] = None
+    url: Optional[str] = None
+    snippet: Optional[str] = None
+
+
+class SerpReply(GridReply):
+    """Reply to a ``serp`` action"""
+
+    results: List[SerpResult] = Field(default_factory=list)
+    query: Optional[str] = None
+
+    _item_type: ClassVar[Any] = SerpResult
+
+    def content(self):
+        return [result if isinstance(result, dict) else result.model_dump(exclude_none=True)
+                for result in self.results or []]
@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+
+APP_LOGGER = "orchestrator"
+
+_listener = None
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """Return the app logger or one of its children (``orchestrator.<name>``)"""
+    return logging.getLogger(f"{APP_LOGGER}.{name}" if name else APP_LOGGER)
+
+
+class Truncated:
+    """
+    Defers ``str(value)`` until a record is emitted and caps its length
+
+    Pass as a logging argument so disabled levels never pay for the repr.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value, max_chars: int = None):
+        self.value = value
+        self.max_chars = max_chars if max_chars is not None else Config.LOG_MAX_CHARS
+
+    def _text(self) -> str:
+        return str(self.value)
+
+    def __str__(self) -> str:
+        text = self._text()
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}… [{len(text) - self.max_chars} more chars]"
+        return text
+
+
+class LazyJSON(Truncated):
+    """Like ``Truncated`` but renders the value as compact JSON"""
+
+    __slots__ = ()
+
+    def _text(self) -> str:
+        try:
+            return json.dumps(self.value, separators=(",", ":"), default=str)
+        except (TypeError, ValueError):
+            return repr(self.value)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes only one in ``1 / rate`` records marked ``extra={"verbose": True}``
+
+    Unmarked records always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "verbose", False):
+            return True
+        if not self.every:
+            return False
+        with self._lock:
+            self._seen += 1
+            return self._seen % self.every == 1 or self.every == 1
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the standard fields plus ``extra`` data"""
+
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # The stock QueueHandler formats in the calling thread; hand the record
+    # over untouched so message formatting happens on the listener thread
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(debug: bool = False, structured: bool = None, stream=None):
+    """
+    Route app logs through a background queue to ``stream`` (stdout by default)
+
+    Args:
+        debug: Log at DEBUG level and include timestamps and logger names
+        structured: Emit JSON lines; defaults to ``Config.LOG_FORMAT == "json"``
+        stream: Destination stream
+    """
+    global _listener
+    if structured is None:
+        structured = Config.LOG_FORMAT == "json"
+
+    if structured:
+        formatter = JSONFormatter()
+    elif debug:
+        formatter = logging.Formatter("%(asctime)s %(levelname)-5s %(name)s: %(message)s")
+    else:
+        formatter = logging.Formatter("%(message)s")
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(formatter)
+    output.addFilter(SamplingFilter(Config.LOG_VERBOSE_SAMPLE_RATE))
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    logger = get_logger()
+    logger.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    logger.setLevel(logging.DEBUG if debug else Config.LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+
+def flush_logging():
+    """Stop the background listener, writing out any queued records"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush_logging)
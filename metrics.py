@@ -0,0 +1,240 @@
+import math
+import os
+import tempfile
+import threading
+from config import Config
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+
+class _HistogramChild:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.counts = [0] * (len(histogram.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = self.histogram.bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (0 if empty)"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.histogram.bounds + [math.inf], counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.histogram.bounds + [math.inf], counts):
+            cumulative += count
+            le = _format_labels(labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(value_sum)}")
+        lines.append(f"{name}_count{labels} {total}")
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    Log-linear (HDR-style) histogram
+
+    Bucket bounds grow geometrically with ``per_octave`` sub-buckets per
+    doubling between ``lowest`` and ``highest``, so relative error is
+    constant and observing is O(1) with no per-sample storage.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), lowest: float = 0.001,
+                 highest: float = 300.0, per_octave: int = 4):
+        super().__init__(name, help, labelnames)
+        self.lowest = lowest
+        self.per_octave = per_octave
+        octaves = math.ceil(math.log2(highest / lowest))
+        self.bounds = [float(f"{lowest * 2 ** (i / per_octave):.4g}") for i in range(octaves * per_octave + 1)]
+
+    def _new_child(self):
+        return _HistogramChild(self)
+
+    def bucket_index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        index = math.ceil(math.log2(value / self.lowest) * self.per_octave - 1e-9)
+        return min(index, len(self.bounds))
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), **bucket_options) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, **bucket_options))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Atomically write all metrics for node_exporter's textfile collector"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".prom")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = Registry()
+
+TASKS = registry.counter("orchestrator_tasks_total", "Tasks finished, by outcome", ("outcome",))
+TASK_SECONDS = registry.histogram("orchestrator_task_seconds", "Wall time per task")
+MODEL_CALLS = registry.counter("orchestrator_model_calls_total", "Chat completion calls", ("model", "outcome"))
+MODEL_SECONDS = registry.histogram("orchestrator_model_call_seconds", "Chat completion latency", ("model",))
+TOKENS = registry.counter("orchestrator_tokens_total", "Tokens reported by the model API", ("model", "kind"))
+GRID_CALLS = registry.counter("harpa_grid_calls_total", "HARPA grid requests", ("action", "outcome"))
+GRID_SECONDS = registry.histogram("harpa_grid_call_seconds", "HARPA grid request latency", ("action",))
+RETRIES = registry.counter("orchestrator_retries_total", "Iterations retried after an error", ("reason",))
+GRID_COALESCED = registry.counter("harpa_grid_coalesced_calls_total", "Grid reads served by an identical in-flight request", ("action",))
+FALLBACKS = registry.counter("harpa_fallbacks_total", "Fallback strategies tried after a failed command", ("strategy", "outcome"))
+COST = registry.counter("orchestrator_cost_usd_total", "Estimated model spend in USD", ("model",))
+BUDGET_DECISIONS = registry.counter("orchestrator_budget_decisions_total", "Budget checks before model calls", ("decision",))
+CACHE_REQUESTS = registry.counter("orchestrator_cache_requests_total", "Lookups in orchestrator caches", ("cache", "result"))
+
+
+def export_textfile():
+    """Write the default registry to ``Config.METRICS_TEXTFILE`` if configured"""
+    if Config.METRICS_TEXTFILE:
+        registry.write_textfile(Config.METRICS_TEXTFILE)
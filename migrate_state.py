@@ -0,0 +1,63 @@
+import argparse
+from config import Config
+from state_manager import list_task_ids, migrate_state
+from state_serializers import CODECS, COMPRESSIONS, StateFormatError, dumps
+
+
+def migrate_all(codec: str, compression: str, task_ids: list = None) -> tuple:
+    """
+    Re-encode every state file in ``Config.PERSISTENT_DIR``
+
+    A file that is missing, corrupt or in an unknown format is reported and
+    skipped; the rest are still migrated.
+
+    Returns:
+        ``(total_before, total_after, failed)``: sizes in bytes and the task
+        IDs whose files could not be read or written
+
+    Raises:
+        StateFormatError: the target format itself is unusable (e.g. its
+            optional package is missing), before any file is touched
+    """
+    dumps({}, codec, compression)
+    total_before = total_after = 0
+    failed = []
+    for task_id in task_ids or list_task_ids():
+        try:
+            before, after = migrate_state(task_id, codec=codec, compression=compression)
+        except OSError as e:
+            print(f"❌ {task_id}: {e.strerror or e}")
+            failed.append(task_id)
+            continue
+        except (StateFormatError, ValueError, EOFError) as e:
+            # Corrupt or unreadable content; the file is left as it was
+            print(f"❌ {task_id}: {e or type(e).__name__}")
+            failed.append(task_id)
+            continue
+        total_before += before
+        total_after += after
+        print(f"📦 {task_id}: {before} → {after} bytes")
+    return total_before, total_after, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Re-encode persisted task state files')
+    parser.add_argument('--format', choices=sorted(CODECS), default=Config.STATE_FORMAT, help='Target state codec')
+    parser.add_argument('--compression', choices=sorted(COMPRESSIONS), default=Config.STATE_COMPRESSION, help='Target compression')
+    parser.add_argument('--dir', type=str, default=Config.PERSISTENT_DIR, help='State directory')
+    parser.add_argument('--task-id', action='append', help='Only migrate these task IDs (repeatable)')
+
+    args = parser.parse_args()
+    Config.PERSISTENT_DIR = args.dir
+
+    try:
+        before, after, failed = migrate_all(args.format, args.compression, args.task_id)
+    except StateFormatError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+    saved = (1 - after / before) * 100 if before else 0
+    print(f"✅ Migrated to {args.format}/{args.compression}: {before} → {after} bytes ({saved:.1f}% smaller)")
+    if failed:
+        print(f"❌ {len(failed)} task(s) not migrated: {', '.join(failed)}")
+        raise SystemExit(1)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyModel:
+    """
+    Samples artificial response latency from a spec string
+
+    Specs (all values in milliseconds):
+        ``none`` | ``fixed:MS`` | ``uniform:LOW:HIGH`` | ``lognormal:MEDIAN:SIGMA``
+    """
+
+    def __init__(self, spec: str = "none", seed: int = None):
+        self.spec = spec
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.args = [float(value) for value in parts[1:]]
+        self.random = random.Random(seed)
+        if self.kind not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency spec: {spec}")
+
+    def sample(self) -> float:
+        """Return a latency in seconds"""
+        if self.kind == "none":
+            return 0.0
+        if self.kind == "fixed":
+            return self.args[0] / 1000
+        if self.kind == "uniform":
+            return self.random.uniform(self.args[0], self.args[1]) / 1000
+        median_ms, sigma = self.args
+        import math
+        return self.random.lognormvariate(math.log(median_ms), sigma) / 1000
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency: str = "none", error_rate: float = 0.0, seed: int = None):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = LatencyModel(latency, seed)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.injected_latency = 0.0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = self.errors = 0
+            self.injected_latency = 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "injected_latency_s": self.injected_latency,
+            }
+
+    def next_response_plan(self):
+        """Sleep for the sampled latency and return whether to fail this request"""
+        with self.lock:
+            delay = self.latency.sample()
+            fail = self.random.random() < self.error_rate
+            self.requests += 1
+            self.errors += fail
+            self.injected_latency += delay
+        if delay:
+            time.sleep(delay)
+        return fail
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY, Nagle plus
+    # delayed ACKs add ~40 ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _GridHandler(_JSONHandler):
+    def do_POST(self):
+        payload = self.read_json()
+        if self.server.next_response_plan():
+            return self.send_json(500, {"error": "injected grid failure"})
+
+        text = self.server.page_text
+        action = payload.get("action")
+        if action == "serp":
+            body = {"status": "ok", "results": [
+                {"title": f"Result {i} for {payload.get('query')}", "url": f"https://example.com/{i}", "snippet": text[:200]}
+                for i in range(10)
+            ]}
+        elif action == "scrape":
+            body = {"status": "ok", "url": payload.get("url"), "results": [
+                {"label": "scraped_data", "value": text}
+            ]}
+        else:
+            body = {"status": "ok", "message": f"Successfully executed on {payload.get('url')}: {text}"}
+        self.send_json(200, body)
+
+
+class MockGridServer(_MockServer):
+    """
+    Stand-in for the HARPA grid API
+
+    Answers ``command``, ``scrape`` and ``serp`` actions with synthetic page
+    text of ``payload_bytes`` characters.
+    """
+
+    def __init__(self, latency: str = "none", error_rate: float = 0.0, payload_bytes: int = 2000, seed: int = None):
+        super().__init__(_GridHandler, latency, error_rate, seed)
+        words = ("price", "return", "policy", "product", "shipping", "review", "$199.99", "in stock")
+        generator = random.Random(seed)
+        text = []
+        size = 0
+        while size < payload_bytes:
+            word = generator.choice(words)
+            text.append(word)
+            size += len(word) + 1
+        self.page_text = " ".join(text)[:payload_bytes]
+
+
+class _OpenAIHandler(_JSONHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self.send_json(404, {"error": {"message": "not found"}})
+        request = self.read_json()
+        if self.server.next_response_plan():
+            return self.send_json(500, {"error": {"message": "injected model failure", "type": "server_error"}})
+
+        messages = request.get("messages", [])
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        if turn + 1 >= self.server.turns:
+            content = "[TASK_COMPLETE] Found the requested information."
+        else:
+            content = f"Go to bestbuy.com and search for product {turn + 1}"
+
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+        prompt_tokens = prompt_chars // 4
+        completion_tokens = len(content) // 4
+        cached_tokens = self.server.cached_prefix_tokens(messages)
+        self.send_json(200, {
+            "id": f"chatcmpl-mock-{self.server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+
+class MockOpenAIServer(_MockServer):
+    """
+    Stand-in for the OpenAI chat completions API
+
+    Replies with a HARPA command until the conversation holds ``turns - 1``
+    assistant messages, then with ``[TASK_COMPLETE]``. Usage includes
+    simulated ``cached_tokens``. Point the client at ``server.url + "/v1"``.
+    """
+
+    def __init__(self, latency: str = "none", error_rate: float = 0.0, turns: int = 3, seed: int = None):
+        super().__init__(_OpenAIHandler, latency, error_rate, seed)
+        self.turns = turns
+        self._prefixes = set()
+
+    def cached_prefix_tokens(self, messages: list) -> int:
+        """
+        Simulate provider prompt caching
+
+        Like OpenAI, reports the longest previously seen message prefix as
+        cached once it reaches 1024 tokens, in 128-token increments.
+        """
+        cached_chars = chars = 0
+        prefix = hashlib.sha256()
+        for message in messages:
+            chars += len(str(message.get("content", "")))
+            prefix.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            key = prefix.digest()
+            with self.lock:
+                if key in self._prefixes:
+                    cached_chars = chars
+                self._prefixes.add(key)
+        tokens = cached_chars // 4
+        return tokens - tokens % 128 if tokens >= 1024 else 0
@@ -0,0 +1,70 @@
+from config import Config
+from TASK_PROFILES import match_profile
+import metrics
+
+SUCCESS_INDICATORS = (
+    "successfully", "completed", "found", "retrieved",
+    "search results", "information located", "task done"
+)
+
+ACTION_VERBS = ("go to", "navigate", "open", "search", "find", "scrape", "click", "visit", "look up", "extract")
+
+ROUTE_CALLS = metrics.registry.counter("orchestrator_route_calls_total", "Model calls per routing decision", ("route", "model"))
+ROUTE_SECONDS = metrics.registry.histogram("orchestrator_route_seconds", "Model call latency per route", ("route",))
+ROUTE_OUTCOMES = metrics.registry.counter("orchestrator_route_outcomes_total", "What happened after a routed turn", ("route", "outcome"))
+ESCALATIONS = metrics.registry.counter("orchestrator_route_escalations_total", "Turns escalated to the strong model", ("route", "reason"))
+
+
+def looks_successful(result: str) -> bool:
+    """True if a HARPA result reads like the step worked"""
+    text = result.lower()
+    return "error" not in text and any(indicator in text for indicator in SUCCESS_INDICATORS)
+
+
+class ModelRouter:
+    """
+    Chooses between a cheap model and the strong model for each turn
+
+    Easy turns go to ``fast_model``: the first command of a task that
+    matches a task profile, and the turn after a HARPA result that already
+    looks successful (usually just completion detection and summarizing).
+    Everything else, and every turn after a failure, uses ``strong_model``.
+    """
+
+    def __init__(self, strong_model: str = None, fast_model: str = None, enabled: bool = None):
+        self.strong_model = strong_model or Config.AI_MODEL
+        self.fast_model = fast_model or Config.FAST_MODEL
+        self.enabled = Config.MODEL_ROUTING if enabled is None else enabled
+
+    def choose(self, task_description: str, iteration: int, last_result: str = None, escalated: bool = False) -> tuple:
+        """Return ``(route, model)`` for the next turn"""
+        if not self.enabled or escalated or self.fast_model == self.strong_model:
+            return "strong", self.strong_model
+        if iteration == 1 and match_profile(task_description):
+            return "profile_first_command", self.fast_model
+        if last_result is not None and looks_successful(last_result):
+            return "completion_check", self.fast_model
+        return "strong", self.strong_model
+
+    def is_ambiguous(self, route: str, reply: str) -> bool:
+        """True if a fast-model reply should be redone by the strong model"""
+        text = (reply or "").strip()
+        if not text:
+            return True
+        lowered = text.lower()
+        if "[TASK_COMPLETE]" in text:
+            # Completing on the very first command is never right
+            return route == "profile_first_command"
+        if route == "profile_first_command" or route == "completion_check":
+            return not any(verb in lowered for verb in ACTION_VERBS) or text.endswith("?")
+        return False
+
+    def observe(self, route: str, model: str, seconds: float):
+        ROUTE_CALLS.labels(route=route, model=model).inc()
+        ROUTE_SECONDS.labels(route=route).observe(seconds)
+
+    def escalate(self, route: str, reason: str):
+        ESCALATIONS.labels(route=route, reason=reason).inc()
+
+    def outcome(self, route: str, outcome: str):
+        ROUTE_OUTCOMES.labels(route=route, outcome=outcome).inc()
@@ -1,39 +1,29 @@
-import os
-from openai import OpenAI
 from config import Config
-from state_manager import save_state, load_state
-from harpa_integration import execute_harpa
+from state_manager import StateStore, StateConflictError
+from harpa_integration import HARPAIntegration, execute_harpa
+from tracing import tracer
+from log_utils import get_logger, Truncated
+from model_router import ModelRouter
+from completion import CompletionDetector
+from artifact_store import STEP_KEYS, ArtifactNotFound, ArtifactStore, step_result, using_store
+from accounting import Budget, BudgetExceeded, TenantLedger, add_usage, empty_usage, usage_from_response
+from TASK_PROFILES import match_profile
+from scheduling import PRIORITIES, TASK_LATENCY, get_limiter, priority_rank, scheduling
+from deadlines import Deadline, TaskCancelled, TaskInterrupted, current_deadline, deadline_scope, interruptible
+from batch import BatchRun
+from cassette import RecordingClient, cassette_path, recording
+import metrics
+import hashlib
+import json
+import threading
+import time
+from contextlib import nullcontext
 
-# Initialize OpenAI client
-client = OpenAI(api_key=Config.OPENAI_API_KEY)
+logger = get_logger()
 
-# Validate API keys
-if Config.OPENAI_API_KEY.startswith("sk-placeholder") or Config.OPENAI_API_KEY == "":
-    print("\n⚠️ WARNING: Using placeholder OpenAI API key")
-    print("Please set your real OpenAI API key in .env file\n")
-    exit(1)
-
-if Config.HARPA_API_KEY.startswith("harpa-placeholder") or Config.HARPA_API_KEY == "":
-    print("\n⚠️ WARNING: Using placeholder HARPA API key")
-    print("Please get your HARPA API key from HARPA extension → Automate tab\n")
-    exit(1)
-
-def run_task(task_description: str, task_id: str = "default_task"):
-    """
-    Execute an AI-powered task using OpenAI and HARPA integration
-    
-    Args:
-        task_description: Natural language description of the task
-        task_id: Unique identifier for persisting task state
-    """
-    # Load previous state if exists
-    state = load_state(task_id)
-    
-    # Initialize messages with FIXED system prompt
-    messages = [
-        {
-            "role": "system", 
-            "content": """You are an AI assistant that controls HARPA AI for web automation tasks.
+# FIXED system prompt sent as the first message of every task. Keep it
+# byte-for-byte stable: any edit invalidates provider-side prompt caches.
+SYSTEM_PROMPT = """You are an AI assistant that controls HARPA AI for web automation tasks.
 
 CRITICAL RULES - FOLLOW EXACTLY:
 1. You MUST execute commands through HARPA before completing any task
@@ -54,123 +44,544 @@ FORMAT YOUR COMMANDS CLEARLY:
 - "Find [specific information] on [website]"
 
 Do NOT complete tasks without actually executing them through HARPA first!"""
-        },
-        {
-            "role": "user", 
-            "content": f"Task: {task_description}\n\nPrevious state: {state.get('progress', []) if state else 'Starting fresh'}\n\nPlease execute this task step by step. Start by giving HARPA the first command."
-        }
-    ]
-    
-    max_iterations = 8  # Increased to allow for proper execution
-    iteration = 0
+
+
+def profile_instructions(name: str, profile: dict) -> str:
+    """Stable system message describing a matched task profile"""
+    steps = "\n".join(f"{number}. {step}" for number, step in enumerate(profile.get("steps", []), 1))
+    return f"Task profile: {profile.get('description', name)}\nKnown good steps:\n{steps}"
+
+
+def prefix_hash(messages: list) -> str:
+    """Short hash of a message list, recorded on traces to check prefix stability"""
+    stable = [(message["role"], message["content"]) for message in messages]
+    return hashlib.sha256(json.dumps(stable).encode("utf-8")).hexdigest()[:16]
+
+
+def validate_api_keys(config=Config) -> bool:
+    """Print a warning and return False if any API key is still a placeholder"""
+    if config.OPENAI_API_KEY.startswith("sk-placeholder") or config.OPENAI_API_KEY == "":
+        print("\n⚠️ WARNING: Using placeholder OpenAI API key")
+        print("Please set your real OpenAI API key in .env file\n")
+        return False
+
+    if config.HARPA_API_KEY.startswith("harpa-placeholder") or config.HARPA_API_KEY == "":
+        print("\n⚠️ WARNING: Using placeholder HARPA API key")
+        print("Please get your HARPA API key from HARPA extension → Automate tab\n")
+        return False
+
+    return True
+
+
+class Orchestrator:
+    """
+    Runs AI-driven HARPA tasks with explicitly injected dependencies
+
+    One instance can run many tasks and is meant to be kept for the life of
+    the process so the OpenAI client and HARPA connection pool stay warm.
+
+    Args:
+        client: OpenAI client (built lazily from ``config`` if omitted)
+        config: Configuration object, defaults to ``Config``
+        executor: Callable taking a command and returning HARPA's result text
+        state_store: Object with ``load(task_id)`` and ``save(task_id, state)``
+        harpa: HARPAIntegration used by the default executor
+        budget: Token/cost limits, defaults to the ``Config`` budgets
+        router: ModelRouter choosing between the fast and strong models
+        completion_detector: Decides locally when a HARPA result finishes the
+            task; pass ``False`` to always let the model decide
+        artifact_store: Keeps full HARPA results and raw grid responses,
+            referenced from state by digest; pass ``False`` to store
+            truncated results inline instead
+    """
+
+    def __init__(self, client=None, config=Config, executor=None, state_store=None, harpa=None, budget=None,
+                 router=None, completion_detector=None, artifact_store=None):
+        self.config = config
+        self._client = RecordingClient(client) if client is not None and config.RECORD_DIR else client
+        self.harpa = harpa or HARPAIntegration(config)
+        self.executor = executor or (lambda command: execute_harpa(command, harpa=self.harpa))
+        self.state_store = state_store or StateStore()
+        self.budget = budget or Budget()
+        self.ledger = TenantLedger(self.state_store)
+        self.router = router or ModelRouter(config.AI_MODEL, config.FAST_MODEL, config.MODEL_ROUTING)
+        if completion_detector is None and config.LOCAL_COMPLETION:
+            completion_detector = CompletionDetector(config.COMPLETION_CONFIDENCE)
+        self.completion_detector = completion_detector or None
+        if artifact_store is None and config.ARTIFACT_STORE:
+            artifact_store = ArtifactStore()
+        self.artifacts = artifact_store or None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # The OpenAI SDK is slow to import, so the client is built on first use
+        # (once, even when several tasks start together)
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    client = OpenAI(api_key=self.config.OPENAI_API_KEY, base_url=self.config.OPENAI_BASE_URL)
+                    self._client = RecordingClient(client) if self.config.RECORD_DIR else client
+        return self._client
+
+    def run_task(self, task_description: str, task_id: str = "default_task", on_event=None, cancel_event=None,
+                 tenant: str = None, priority: str = None, deadline: float = None):
+        """
+        Execute an AI-powered task using OpenAI and HARPA integration
     
-    while iteration < max_iterations:
+        Args:
+            task_description: Natural language description of the task
+            task_id: Unique identifier for persisting task state
+            on_event: Optional callable receiving progress event dicts
+            cancel_event: Optional threading.Event; when set the task stops,
+                abandoning queued calls and any grid response being read
+            tenant: Account the task's token usage and cost is billed to
+            priority: "interactive", "normal" or "batch"; decides who waits
+                first when model and grid calls are queued
+            deadline: Seconds the task may take (default
+                ``TASK_DEADLINE_SECONDS``); every model and grid timeout is
+                capped at the time left
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        priority = priority or self.config.DEFAULT_PRIORITY
+        priority_rank(priority)
+        deadline = Deadline(deadline or self.config.TASK_DEADLINE_SECONDS or None, cancel_event)
         try:
-            iteration += 1
-            print(f"\n--- Iteration {iteration} ---")
-            
-            # Make API call to OpenAI with proper parameters
-            response = client.chat.completions.create(
-                model=Config.AI_MODEL,
-                messages=messages,
-                max_tokens=Config.MAX_TOKENS,
-                timeout=Config.REQUEST_TIMEOUT,
-                temperature=0.1  # Very low temperature for consistent automation
+            tenant = tenant or self.config.DEFAULT_TENANT
+            with scheduling(priority, tenant), deadline_scope(deadline), using_store(self.artifacts), \
+                    self._recording(task_description, task_id, tenant, priority) as cassette, \
+                    tracer.span("task", task_id=task_id, task=task_description[:200],
+                                tenant=tenant, priority=priority) as span:
+                result = self._run_task(task_description, task_id, on_event, deadline, tenant)
+                span.set_attribute("succeeded", result is not None)
+                if cassette is not None:
+                    cassette.meta["result"] = result
+                outcome = "succeeded" if result is not None else "failed"
+                return result
+        finally:
+            metrics.TASKS.labels(outcome=outcome).inc()
+            metrics.TASK_SECONDS.observe(time.perf_counter() - start)
+            TASK_LATENCY.labels(priority=priority).observe(time.perf_counter() - start)
+
+    def _recording(self, task_description: str, task_id: str, tenant: str, priority: str):
+        """Cassette of the task's model and grid calls when ``RECORD_DIR`` is set (see ``cassette``)"""
+        if not self.config.RECORD_DIR:
+            return nullcontext()
+        # Replays start from the state this run started from, with results kept
+        # in this machine's artifact store copied inline
+        state = self.state_store.load(task_id)
+        state["progress"] = [dict({key: value for key, value in step.items() if key not in STEP_KEYS},
+                                  result=step_result(step, self.artifacts))
+                             for step in state.get("progress", [])]
+        return recording(cassette_path(self.config.RECORD_DIR, task_id), task=task_description, task_id=task_id,
+                         tenant=tenant, priority=priority, state=state)
+
+    def run_many(self, tasks, max_workers: int = None, ordered: bool = True, **kwargs) -> BatchRun:
+        """
+        Run ``tasks`` in parallel and return a ``BatchRun`` to iterate over their outcomes
+
+        Safe to call from several threads at once. Tasks share this
+        instance's OpenAI client and HARPA connection pool but never each
+        other's messages or state.
+
+        Args:
+            tasks: Description strings or dicts with "task" and optionally
+                "task_id", "tenant", "priority" and "deadline"
+            max_workers: Tasks run at once (default ``RUN_MANY_WORKERS``)
+            ordered: Yield outcomes in submission order; False yields each
+                as soon as its task finishes
+            **kwargs: ``on_event``, ``cancel_event`` and per-batch defaults
+                for ``tenant``, ``priority`` and ``deadline``
+        """
+        return BatchRun(self, tasks, max_workers=max_workers, ordered=ordered, **kwargs)
+
+    def prompt_prefix(self, task_description: str) -> list:
+        """The byte-stable leading messages for a task"""
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        matched = match_profile(task_description)
+        if matched:
+            messages.append({"role": "system", "content": profile_instructions(*matched)})
+        messages.append({
+            "role": "user",
+            "content": f"Task: {task_description}\n\nPlease execute this task step by step. Start by giving HARPA the first command."
+        })
+        return messages
+
+    def build_messages(self, task_description: str, progress: list) -> list:
+        """
+        Opening messages for a task, laid out so providers can cache the prefix
+
+        Content that never changes for a task comes first: the system prompt,
+        the matched profile's instructions and the task itself. Progress from
+        earlier runs changes on every resume, so it goes last as its own
+        message, serialized deterministically.
+        """
+        messages = self.prompt_prefix(task_description)
+        if progress:
+            preview = json.dumps(self._progress_preview(progress), ensure_ascii=False, separators=(",", ":"))
+            messages.append({
+                "role": "user",
+                "content": f"Previous state (progress from an earlier run of this task; continue from here): {preview}"
+            })
+        return messages
+
+    def _progress_preview(self, progress: list) -> list:
+        """Progress steps with results cut to 500 characters, as shown to the model"""
+        return [
+            dict({key: value for key, value in step.items() if key not in STEP_KEYS},
+                 result=step_result(step, self.artifacts)[:500])
+            for step in progress
+        ]
+
+    def _call_model(self, messages: list, iteration: int, model: str, on_late=None):
+        """
+        Send the conversation to the chat completions API, once the shared model limiter admits it
+
+        If the task stops while the request is in flight, the slot and span
+        are released right away and ``on_late(response)`` receives the reply
+        should it still arrive.
+        """
+        with get_limiter("model").slot() as waited:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                with tracer.span("model.call", model=model, iteration=iteration, messages=len(messages),
+                                 queue_seconds=round(waited, 4)) as span:
+                    timeout = current_deadline().timeout(self.config.REQUEST_TIMEOUT)
+                    response = interruptible(lambda: self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=self.config.MAX_TOKENS,
+                        timeout=timeout,
+                        temperature=0.1  # Very low temperature for consistent automation
+                    ), cleanup=on_late)
+                    outcome = "ok"
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        _, _, cached_tokens = usage_from_response(response)
+                        span.set_attributes(prompt_tokens=usage.prompt_tokens,
+                                            completion_tokens=usage.completion_tokens,
+                                            cached_tokens=cached_tokens)
+                        metrics.TOKENS.labels(model=model, kind="prompt").inc(usage.prompt_tokens)
+                        metrics.TOKENS.labels(model=model, kind="completion").inc(usage.completion_tokens)
+                        metrics.TOKENS.labels(model=model, kind="cached").inc(cached_tokens)
+                        metrics.CACHE_REQUESTS.labels(cache="prompt", result="hit" if cached_tokens else "miss").inc()
+                        logger.debug("🧊 %d of %d prompt tokens served from the provider cache",
+                                     cached_tokens, usage.prompt_tokens)
+                    return response
+            finally:
+                metrics.MODEL_CALLS.labels(model=model, outcome=outcome).inc()
+                metrics.MODEL_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+
+    def _choose_model(self, task_usage: dict, tenant: str, task_description: str, iteration: int,
+                      last_result: str, escalated: bool) -> tuple:
+        """Return ``(route, model)`` for the next call, enforcing the task and tenant budgets"""
+        tenant_usage = self.ledger.get(tenant) if self.budget.tenant_cost_usd else None
+        decision = self.budget.check(task_usage, tenant_usage)
+        metrics.BUDGET_DECISIONS.labels(decision=decision).inc()
+        if decision == "exceeded":
+            raise BudgetExceeded(
+                f"task has used {task_usage['prompt_tokens'] + task_usage['completion_tokens']} tokens "
+                f"(${task_usage['cost_usd']:.4f})"
+                + (f", tenant '{tenant}' ${tenant_usage['cost_usd']:.4f}" if tenant_usage else "")
             )
+        if decision == "downshift" and self.config.BUDGET_DOWNSHIFT_MODEL:
+            return "budget_downshift", self.config.BUDGET_DOWNSHIFT_MODEL
+        return self.router.choose(task_description, iteration, last_result, escalated)
+
+    def _routed_call(self, messages: list, iteration: int, route: str, model: str, task_usage: dict, tenant: str):
+        start = time.perf_counter()
+        # A call still running when the task is cancelled is billed once it returns
+        response = self._call_model(messages, iteration, model,
+                                    on_late=lambda late: self._record_usage(task_usage, tenant, model, late))
+        self.router.observe(route, model, time.perf_counter() - start)
+        self._record_usage(task_usage, tenant, model, response)
+        return response.choices[0].message.content
+
+    def _record_usage(self, task_usage: dict, tenant: str, model: str, response):
+        prompt_tokens, completion_tokens, cached_tokens = usage_from_response(response)
+        cost = add_usage(task_usage, model, prompt_tokens, completion_tokens, cached_tokens)
+        metrics.COST.labels(model=model).inc(cost)
+        self.ledger.record(tenant, model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def _run_task(self, task_description: str, task_id: str, on_event, deadline: Deadline, tenant: str):
+        def emit(event_type: str, **data):
+            if on_event:
+                on_event(dict(data, type=event_type, task_id=task_id))
+
+        # Load previous state if exists
+        with tracer.span("state.load"):
+            state = self.state_store.load(task_id)
+        state["tenant"] = tenant
+        task_usage = state.setdefault("usage", empty_usage())
+    
+        # Initialize messages with FIXED system prompt
+        with tracer.span("prompt.build") as span:
+            messages = self.build_messages(task_description, state.get("progress", []))
+            span.set_attributes(prompt_chars=sum(len(message["content"]) for message in messages),
+                                prefix_hash=prefix_hash(self.prompt_prefix(task_description)))
+    
+        max_iterations = 8  # Increased to allow for proper execution
+        iteration = 0
+        last_result = None
+        escalated = False  # Sticky: after any failure every turn uses the strong model
+    
+        while iteration < max_iterations:
+            route = None
+            ai_response = None
+            try:
+                deadline.check()
+                iteration += 1
+                logger.info("\n--- Iteration %d ---", iteration)
+                emit("iteration", iteration=iteration)
             
-            # Extract AI response
-            ai_response = response.choices[0].message.content
-            print(f"🤖 AI Command: {ai_response}")
-            
-            # Check for task completion BEFORE executing
-            if "[TASK_COMPLETE]" in ai_response:
-                print("✅ Task marked complete by AI!")
-                # Save final state
-                if state:
-                    state['status'] = 'completed'
-                    state['final_result'] = ai_response
-                    save_state(task_id, state)
-                return ai_response.replace("[TASK_COMPLETE]", "").strip()
+                # Make API call to OpenAI with proper parameters
+                route, model = self._choose_model(task_usage, tenant, task_description, iteration,
+                                                  last_result, escalated)
+                ai_response = self._routed_call(messages, iteration, route, model, task_usage, tenant)
+
+                if model == self.router.fast_model and route != "budget_downshift" \
+                        and self.router.is_ambiguous(route, ai_response):
+                    logger.info("🔀 Ambiguous %s reply from %s, asking %s", route, model, self.router.strong_model)
+                    self.router.escalate(route, "ambiguous")
+                    self.router.outcome(route, "ambiguous")
+                    route, model = "escalated", self.router.strong_model
+                    ai_response = self._routed_call(messages, iteration, route, model, task_usage, tenant)
             
-            # Execute command through HARPA
-            print("🔄 Executing command through HARPA...")
-            result = execute_harpa(ai_response)
-            print(f"🌐 HARPA Result: {result}")
+                logger.info("🤖 AI Command: %s", ai_response)
+                emit("command", iteration=iteration, command=ai_response)
             
-            # Update state and messages
-            if not state:
-                state = {"task": task_description, "progress": []}
+                # Check for task completion BEFORE executing
+                if "[TASK_COMPLETE]" in ai_response:
+                    logger.info("✅ Task marked complete by AI!")
+                    # Save final state
+                    if state:
+                        state['status'] = 'completed'
+                        state['final_result'] = ai_response
+                        with tracer.span("state.save"):
+                            self.state_store.save(task_id, state)
+                    self.router.outcome(route, "completed")
+                    final_result = ai_response.replace("[TASK_COMPLETE]", "").strip()
+                    emit("completed", iteration=iteration, result=final_result)
+                    return final_result
             
-            state["progress"].append({
-                "iteration": iteration,
-                "command": ai_response,
-                "result": result[:500]  # Truncate long results for storage
-            })
-            save_state(task_id, state)
+                # Execute command through HARPA
+                logger.info("🔄 Executing command through HARPA...")
+                with tracer.span("harpa.call", iteration=iteration, command_chars=len(ai_response)) as span:
+                    result = self.executor(ai_response)
+                    span.set_attribute("result_chars", len(result))
+                logger.info("🌐 HARPA Result: %s", Truncated(result))
+                emit("result", iteration=iteration, result=result[:500])
+                last_result = result
+                harpa_failed = "Error" in result or "timed out" in result
+                self.router.outcome(route, "harpa_error" if harpa_failed else "harpa_ok")
+                if harpa_failed and not escalated:
+                    self.router.escalate(route, "harpa_error")
+                    escalated = True
             
-            # Add both AI response and HARPA result to message history
-            messages.append({"role": "assistant", "content": ai_response})
-            messages.append({
-                "role": "user", 
-                "content": f"HARPA executed your command and returned:\n\n{result}\n\nBased on these results, what should we do next? If the task is successfully completed, respond with [TASK_COMPLETE]."
-            })
+                # Update state and messages
+                if not state:
+                    state = {"task": task_description, "progress": []}
             
-            # Auto-detect potential completion based on result
-            success_indicators = [
-                "successfully", "completed", "found", "retrieved", 
-                "search results", "information located", "task done"
-            ]
+                # Let the local detector end the task without another model round trip
+                detection = None
+                if self.completion_detector and not harpa_failed:
+                    with tracer.span("completion.detect") as span:
+                        detection = self.completion_detector.detect(task_description, result)
+                        span.set_attributes(confidence=detection.confidence, complete=detection.complete)
+
+                step = {"iteration": iteration, "command": ai_response}
+                if self.artifacts:
+                    # Keep the full result and the raw grid response retrievable;
+                    # state holds only their digests and sizes
+                    with tracer.span("artifact.put", result_chars=len(result)):
+                        step["artifact"] = self.artifacts.put(result)
+                        # The grid layer already streamed the raw body into the store
+                        raw_artifact = getattr(result, "raw_artifact", None)
+                        if raw_artifact:
+                            try:
+                                self.artifacts.retain(raw_artifact["digest"])
+                                step["raw_artifact"] = raw_artifact
+                            except ArtifactNotFound:
+                                # Shared by a task of another orchestrator with its own store
+                                logger.debug("Raw grid response %s is not in this store", raw_artifact["digest"])
+                else:
+                    step["result"] = result[:500]  # Truncate long results for storage
+                if detection is not None:
+                    step["completion_confidence"] = round(detection.confidence, 3)
+                state["progress"].append(step)
+
+                if detection is not None and detection.complete:
+                    logger.info("✅ Task completion detected locally (confidence %.2f: %s)",
+                                detection.confidence, ", ".join(detection.reasons))
+                    state['status'] = 'completed'
+                    state['completed_by'] = 'detector'
+                    state['final_result'] = result
+                    with tracer.span("state.save"):
+                        self.state_store.save(task_id, state)
+                    emit("completed", iteration=iteration, result=result, detector=True)
+                    return result
+
+                with tracer.span("state.save"):
+                    self.state_store.save(task_id, state)
             
-            if any(indicator in result.lower() for indicator in success_indicators):
-                print("🎯 HARPA result suggests possible completion...")
-                # Don't auto-complete, let AI decide
+                # Add both AI response and HARPA result to message history
+                messages.append({"role": "assistant", "content": ai_response})
+                messages.append({
+                    "role": "user", 
+                    "content": f"HARPA executed your command and returned:\n\n{result}\n\nBased on these results, what should we do next? If the task is successfully completed, respond with [TASK_COMPLETE]."
+                })
             
-        except Exception as e:
-            print(f"❌ Error in iteration {iteration}: {str(e)}")
+                if detection is not None and detection.confidence >= 0.4:
+                    logger.info("🎯 HARPA result suggests possible completion (confidence %.2f)...",
+                                detection.confidence)
             
-            # Try to recover with more specific error handling
-            error_message = str(e)
-            if "401" in error_message or "unauthorized" in error_message.lower():
-                print("🔑 This looks like an API key issue. Check your HARPA API key.")
+            except TaskInterrupted as e:
+                status = "cancelled" if isinstance(e, TaskCancelled) else "deadline_exceeded"
+                logger.info("🛑 Task stopped: %s", e)
+                if ai_response is not None:
+                    # Keep the command that was cut short so a resumed run knows it was issued
+                    state.setdefault("progress", []).append({"iteration": iteration, "command": ai_response,
+                                                             "result": "", "interrupted": status})
+                state['status'] = status
+                with tracer.span("state.save"):
+                    self.state_store.save(task_id, state)
+                emit(status, iteration=iteration)
                 return None
-            elif "timeout" in error_message.lower():
-                print("⏰ Request timed out. HARPA might be busy.")
-                if iteration < max_iterations:
-                    print("🔄 Retrying...")
-                    messages.append({
-                        "role": "user", 
-                        "content": "The previous command timed out. Please try the same action again or try a simpler approach."
-                    })
-                    continue
-            else:
-                print(f"🐛 Unexpected error: {error_message}")
-                if iteration < max_iterations:
-                    print("🔄 Attempting to recover...")
-                    messages.append({
-                        "role": "user", 
-                        "content": f"There was an error: {error_message}. Please try a different approach or simpler command."
-                    })
-                else:
-                    print("💥 Max retries exceeded")
+            except BudgetExceeded as e:
+                logger.warning("💸 Budget exhausted: %s", e)
+                state['status'] = 'budget_exceeded'
+                with tracer.span("state.save"):
+                    self.state_store.save(task_id, state)
+                emit("budget_exceeded", iteration=iteration, usage=task_usage)
+                return None
+            except StateConflictError as e:
+                logger.error("🔒 State conflict: %s", e)
+                logger.error("💡 Another worker is running this task ID; use a different --task-id")
+                return None
+            except Exception as e:
+                logger.error("❌ Error in iteration %d: %s", iteration, e)
+                emit("error", iteration=iteration, error=str(e))
+                if route:
+                    self.router.outcome(route, "error")
+                escalated = True
+            
+                # Try to recover with more specific error handling
+                error_message = str(e)
+                if "401" in error_message or "unauthorized" in error_message.lower():
+                    logger.error("🔑 This looks like an API key issue. Check your HARPA API key.")
                     return None
+                elif "timeout" in error_message.lower():
+                    logger.warning("⏰ Request timed out. HARPA might be busy.")
+                    if iteration < max_iterations:
+                        logger.info("🔄 Retrying...")
+                        metrics.RETRIES.labels(reason="timeout").inc()
+                        messages.append({
+                            "role": "user", 
+                            "content": "The previous command timed out. Please try the same action again or try a simpler approach."
+                        })
+                        continue
+                else:
+                    logger.warning("🐛 Unexpected error: %s", error_message)
+                    if iteration < max_iterations:
+                        logger.info("🔄 Attempting to recover...")
+                        metrics.RETRIES.labels(reason="error").inc()
+                        messages.append({
+                            "role": "user", 
+                            "content": f"There was an error: {error_message}. Please try a different approach or simpler command."
+                        })
+                    else:
+                        logger.error("💥 Max retries exceeded")
+                        return None
     
-    print("⏰ Max iterations reached - task may be incomplete")
-    print("💡 Try breaking down the task into smaller steps")
+        logger.warning("⏰ Max iterations reached - task may be incomplete")
+        logger.warning("💡 Try breaking down the task into smaller steps")
+        emit("incomplete", iteration=iteration)
     
-    # Return the progress made
-    if state and state.get("progress"):
-        return f"Task incomplete but made progress: {len(state['progress'])} steps completed"
-    return None
+        # Return the progress made
+        if state and state.get("progress"):
+            return f"Task incomplete but made progress: {len(state['progress'])} steps completed"
+        return None
+
+
+_default_orchestrator = None
+_default_orchestrator_lock = threading.Lock()
+
+
+def get_orchestrator() -> Orchestrator:
+    """Return the process-wide default Orchestrator, creating it on first use"""
+    global _default_orchestrator
+    if _default_orchestrator is None:
+        with _default_orchestrator_lock:
+            if _default_orchestrator is None:
+                _default_orchestrator = Orchestrator()
+    return _default_orchestrator
+
+
+def run_task(task_description: str, task_id: str = "default_task", **kwargs):
+    """
+    Execute a task with the default Orchestrator
+
+    Args:
+        task_description: Natural language description of the task
+        task_id: Unique identifier for persisting task state
+        **kwargs: Passed through to ``Orchestrator.run_task``
+    """
+    return get_orchestrator().run_task(task_description, task_id, **kwargs)
+
+
+def run_many(tasks, max_workers: int = None, **kwargs) -> BatchRun:
+    """
+    Run tasks in parallel with the default Orchestrator
+
+    Args:
+        tasks: Description strings or task dicts
+        max_workers: Tasks run at once (default ``RUN_MANY_WORKERS``)
+        **kwargs: Passed through to ``Orchestrator.run_many``
+    """
+    return get_orchestrator().run_many(tasks, max_workers, **kwargs)
 
 if __name__ == "__main__":
     import argparse
+    from log_utils import configure_logging
     
     parser = argparse.ArgumentParser(description='AI Task Orchestrator with HARPA')
-    parser.add_argument('--task', type=str, required=True, help='Task description')
+    parser.add_argument('--task', type=str, help='Task description')
     parser.add_argument('--task-id', type=str, default="default_task", help='Task identifier')
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
+    parser.add_argument('--tenant', type=str, help='Tenant billed for token usage')
+    parser.add_argument('--priority', choices=PRIORITIES, default="interactive",
+                        help='Scheduling class when sharing model and grid capacity')
+    parser.add_argument('--deadline', type=float, help='Seconds the task may take (default TASK_DEADLINE_SECONDS)')
+    parser.add_argument('--trace-dir', type=str, help='Write per-task OTLP traces and JSON timing summaries here')
+    parser.add_argument('--record-dir', type=str, help='Record each task\'s model and grid calls as a cassette here')
+    parser.add_argument('--serve', action='store_true', help='Run the HTTP task server instead of a single task')
+    parser.add_argument('--host', type=str, default=Config.SERVER_HOST, help='Server bind address')
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT, help='Server port')
     
     args = parser.parse_args()
+    configure_logging(debug=args.debug)
+    if not args.serve and not args.task:
+        parser.error("--task is required unless --serve is given")
+
+    if not validate_api_keys():
+        exit(1)
+
+    if args.trace_dir and args.trace_dir != Config.TRACE_DIR:
+        from tracing import file_exporter
+        tracer.add_exporter(file_exporter(args.trace_dir))
+    if args.record_dir:
+        Config.RECORD_DIR = args.record_dir
+
+    if args.serve:
+        from server import serve
+        serve(args.host, args.port)
+        exit(0)
+
+    import atexit
+    atexit.register(metrics.export_textfile)
     
     print("🤖 AI-Powered HARPA Orchestrator")
     print("=" * 50)
@@ -179,7 +590,8 @@ if __name__ == "__main__":
     print(f"🔧 Debug mode: {'ON' if args.debug else 'OFF'}")
     print("=" * 50)
     
-    result = run_task(args.task, args.task_id)
+    result = run_task(args.task, args.task_id, tenant=args.tenant, priority=args.priority,
+                      deadline=args.deadline)
     
     print("\n" + "=" * 50)
     if result:
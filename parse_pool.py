@@ -0,0 +1,140 @@
+import concurrent.futures
+import threading
+import time
+from config import Config
+from deadlines import current_deadline
+from log_utils import get_logger
+from result_extraction import condense, extraction_settings, record_result_chars
+import metrics
+
+# multiprocessing is imported on first offload; most runs never need it
+logger = get_logger("parse")
+
+PARSE_SECONDS = metrics.registry.histogram("harpa_result_parse_seconds",
+                                           "Time to parse and condense a grid reply, as seen by the caller", ("mode",))
+
+
+def condense_body(body: bytes, reply_type, settings: tuple) -> tuple:
+    """
+    ``(ok, text, raw_chars)`` for a 200 reply body: validate it as ``reply_type`` and condense it
+
+    Records no metrics, so it gives the same result in a worker process;
+    ``settings`` is ``extraction_settings()`` taken in the parent.
+    """
+    reply = reply_type.parse(body)
+    return reply.ok, condense(reply.content(), *settings), reply.response_bytes
+
+
+def _condense_shared(name: str, size: int, reply_type, settings: tuple) -> tuple:
+    """Worker side: read the body from shared memory block ``name``"""
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        body = bytes(block.buf[:size])
+    finally:
+        block.close()
+    return condense_body(body, reply_type, settings)
+
+
+def _unlink(block):
+    block.close()
+    block.unlink()
+
+
+class ParsePool:
+    """
+    Process pool for parsing and condensing large grid replies
+
+    The body is copied once into a shared memory block and only the block's
+    name crosses the process boundary, so large payloads are never pickled
+    through the pool's pipe; the condensed text and the reply's size are
+    all that come back. Workers get the parent's extraction settings with
+    each reply, and the parent records the size metrics, so offloaded and
+    in-thread parses condense and count a reply the same way.
+    Workers are started with "spawn" (the orchestrator runs threads, which
+    do not survive fork safely) and only when the first large reply arrives.
+
+    Args:
+        workers: Worker processes; 0 parses everything in the calling thread
+        min_bytes: Bodies smaller than this are parsed in the calling thread
+    """
+
+    def __init__(self, workers: int = None, min_bytes: int = None):
+        self.workers = Config.PARSE_WORKERS if workers is None else workers
+        self.min_bytes = Config.PARSE_OFFLOAD_BYTES if min_bytes is None else min_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def offloads(self, size: int) -> bool:
+        return self.workers > 0 and size >= self.min_bytes
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def summarize(self, body, reply_type) -> tuple:
+        """
+        ``(ok, text)`` for a 200 reply body (bytes or a buffer such as a memoryview)
+
+        Waiting stops with ``TaskInterrupted`` when the running task is
+        cancelled or late; the worker's result is then discarded.
+        """
+        ok, text, raw_chars = self._condense(body, reply_type, extraction_settings())
+        record_result_chars(raw_chars, len(text))
+        return ok, text
+
+    def _condense(self, body, reply_type, settings: tuple) -> tuple:
+        start = time.perf_counter()
+        if not self.offloads(len(body)):
+            try:
+                return condense_body(bytes(body), reply_type, settings)
+            finally:
+                PARSE_SECONDS.labels(mode="inline").observe(time.perf_counter() - start)
+
+        from multiprocessing import shared_memory
+        block = shared_memory.SharedMemory(create=True, size=len(body))
+        try:
+            block.buf[:len(body)] = body
+            future = self._pool().submit(_condense_shared, block.name, len(body), reply_type, settings)
+        except BaseException:
+            _unlink(block)
+            raise
+        future.add_done_callback(lambda _: _unlink(block))
+
+        deadline = current_deadline()
+        try:
+            while True:
+                try:
+                    return future.result(timeout=deadline.poll_timeout())
+                except concurrent.futures.TimeoutError:
+                    deadline.check()
+        except concurrent.futures.process.BrokenProcessPool:
+            logger.warning("⚠️ Parse worker died; parsing in-thread and restarting the pool")
+            self.shutdown()
+            return condense_body(bytes(body), reply_type, settings)
+        finally:
+            PARSE_SECONDS.labels(mode="pool").observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """Return the process-wide parse pool, configured from ``Config``"""
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ParsePool()
+    return _parse_pool
@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from config import Config
+from deadlines import current_deadline
+from log_utils import get_logger
+import metrics
+
+logger = get_logger("politeness")
+
+QUEUE_DEPTH = metrics.registry.gauge("harpa_domain_queue_depth", "Grid requests waiting for a domain slot", ("domain",))
+ACTIVE = metrics.registry.gauge("harpa_domain_active_requests", "Grid requests in flight per domain", ("domain",))
+WAIT_SECONDS = metrics.registry.histogram("harpa_domain_wait_seconds", "Time spent queued for a domain slot", ("domain",))
+
+
+def domain_of(url: str) -> str:
+    """Host of ``url`` without port or a leading ``www.``, lowercased"""
+    host = (urlsplit(url if "//" in url else f"//{url}").hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class DomainLimits:
+    """
+    How hard one domain may be hit
+
+    Args:
+        max_concurrency: Requests in flight at once (0 for unlimited)
+        min_interval: Seconds between request starts
+        crawl_delay: Site-requested delay in seconds; the larger of this and
+            ``min_interval`` is used
+    """
+
+    __slots__ = ("max_concurrency", "spacing")
+
+    def __init__(self, max_concurrency: int = 0, min_interval: float = 0.0, crawl_delay: float = 0.0):
+        self.max_concurrency = max_concurrency
+        self.spacing = max(min_interval, crawl_delay)
+
+    def __repr__(self):
+        return f"DomainLimits(max_concurrency={self.max_concurrency}, spacing={self.spacing})"
+
+
+class _Domain:
+    __slots__ = ("limits", "active", "queue", "next_start")
+
+    def __init__(self, limits: DomainLimits):
+        self.limits = limits
+        self.active = 0
+        self.queue = deque()
+        self.next_start = 0.0
+
+
+class DomainScheduler:
+    """
+    Per-domain concurrency and spacing for outgoing fetches
+
+    Callers over a domain's limit wait in a FIFO queue instead of being
+    rejected, until their task is cancelled or runs out of time. Each
+    domain has its own queue, so a slow or strict domain never holds up
+    requests to another one.
+
+    Args:
+        default: Limits for domains without an override
+        overrides: ``{domain: DomainLimits}``; a domain also matches its
+            subdomains ("bestbuy.com" covers "api.bestbuy.com")
+    """
+
+    def __init__(self, default: DomainLimits = None, overrides: dict = None):
+        self.default = default or DomainLimits()
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._domains = {}
+
+    @classmethod
+    def from_config(cls, config=Config) -> "DomainScheduler":
+        """Limits from ``GRID_DOMAIN_*`` settings and ``GRID_DOMAIN_LIMITS_PATH`` overrides"""
+        default = DomainLimits(config.GRID_DOMAIN_CONCURRENCY, config.GRID_DOMAIN_INTERVAL_MS / 1000)
+        overrides = {}
+        if config.GRID_DOMAIN_LIMITS_PATH:
+            with open(config.GRID_DOMAIN_LIMITS_PATH) as f:
+                for domain, entry in json.load(f).items():
+                    overrides[domain.lower()] = DomainLimits(
+                        entry.get("max_concurrency", default.max_concurrency),
+                        entry.get("min_interval_ms", config.GRID_DOMAIN_INTERVAL_MS) / 1000,
+                        entry.get("crawl_delay", 0.0),
+                    )
+        return cls(default, overrides)
+
+    def limits_for(self, domain: str) -> DomainLimits:
+        labels = domain.split(".")
+        for index in range(len(labels) - 1):
+            limits = self.overrides.get(".".join(labels[index:]))
+            if limits is not None:
+                return limits
+        return self.default
+
+    @contextmanager
+    def slot(self, domain: str):
+        """
+        Hold one request slot for ``domain`` for the duration of the block
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        ticket = object()
+        deadline = current_deadline()
+        queued_at = time.monotonic()
+        with self._changed:
+            state = self._domains.get(domain)
+            if state is None:
+                state = self._domains[domain] = _Domain(self.limits_for(domain))
+            limits = state.limits
+            state.queue.append(ticket)
+            QUEUE_DEPTH.labels(domain=domain).set(len(state.queue))
+            try:
+                while True:
+                    deadline.check()
+                    now = time.monotonic()
+                    if state.queue[0] is ticket:
+                        if limits.max_concurrency and state.active >= limits.max_concurrency:
+                            self._changed.wait(deadline.poll_timeout())
+                            continue
+                        if now < state.next_start:
+                            self._changed.wait(deadline.poll_timeout(state.next_start - now))
+                            continue
+                        break
+                    self._changed.wait(deadline.poll_timeout())
+            finally:
+                state.queue.remove(ticket)
+                QUEUE_DEPTH.labels(domain=domain).set(len(state.queue))
+                self._changed.notify_all()
+            state.active += 1
+            state.next_start = now + limits.spacing
+            ACTIVE.labels(domain=domain).set(state.active)
+
+        waited = now - queued_at
+        WAIT_SECONDS.labels(domain=domain).observe(waited)
+        if waited >= 1:
+            logger.debug("🚦 Waited %.1fs for a %s slot", waited, domain)
+        try:
+            yield waited
+        finally:
+            with self._changed:
+                state.active -= 1
+                ACTIVE.labels(domain=domain).set(state.active)
+                self._changed.notify_all()
+
+    def snapshot(self) -> dict:
+        """``{domain: {"active", "queued", "max_concurrency", "spacing"}}`` for domains seen so far"""
+        with self._lock:
+            return {
+                domain: {
+                    "active": state.active,
+                    "queued": len(state.queue),
+                    "max_concurrency": state.limits.max_concurrency,
+                    "spacing": state.limits.spacing,
+                }
+                for domain, state in self._domains.items()
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> DomainScheduler:
+    """Return the process-wide scheduler, built on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = DomainScheduler.from_config()
+    return _scheduler
@@ -0,0 +1,235 @@
+import io
+import json
+import os
+import re
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# The body of a JSON string up to its closing quote; never ends inside an escape
+_STRING_RUN = re.compile(r'[^"\\]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\]*)*')
+
+
+class ResponseTooLarge(Exception):
+    """Raised when a grid response body exceeds ``Config.GRID_MAX_RESPONSE_BYTES``"""
+
+
+class SpooledBody:
+    """
+    Response body kept in memory up to a threshold, then spilled to a file
+
+    ``path`` is set once the body has been spilled; the file stays on disk
+    until ``close()`` so typed replies can hand it out as a handle.
+    """
+
+    def __init__(self, memory_bytes: int, spill_dir: str = None):
+        self.memory_bytes = memory_bytes
+        self.spill_dir = spill_dir
+        self.size = 0
+        self.path = None
+        self._file = io.BytesIO()
+
+    @classmethod
+    def read(cls, chunks, max_bytes: int, memory_bytes: int, spill_dir: str = None) -> "SpooledBody":
+        """Consume an iterable of byte chunks, raising ``ResponseTooLarge`` past ``max_bytes``"""
+        body = cls(memory_bytes, spill_dir)
+        try:
+            for chunk in chunks:
+                body.write(chunk)
+                if max_bytes and body.size > max_bytes:
+                    raise ResponseTooLarge(f"Grid response exceeds {max_bytes} bytes")
+        except BaseException:
+            body.close()
+            raise
+        body._file.flush()
+        return body
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.path is None and self.size > self.memory_bytes:
+            self._spill()
+        self._file.write(chunk)
+
+    def _spill(self):
+        import tempfile
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        spilled = tempfile.NamedTemporaryFile(dir=self.spill_dir, prefix="harpa_", suffix=".json", delete=False)
+        spilled.write(self._file.getvalue())
+        self._file = spilled
+        self.path = spilled.name
+
+    def finish(self):
+        """Done writing: flush the body and let go of a spilled file's handle (the file stays until ``close()``)"""
+        if self.in_memory:
+            self._file.flush()
+        else:
+            self._file.close()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def getvalue(self) -> bytes:
+        """The whole body; only available while it is held in memory"""
+        if not self.in_memory:
+            raise ValueError(f"Body was spilled to {self.path}; stream it with open_text()")
+        return self._file.getvalue()
+
+    def getbuffer(self) -> memoryview:
+        """Zero-copy view of an in-memory body; release it before ``close()``"""
+        if not self.in_memory:
+            raise ValueError(f"Body was spilled to {self.path}; stream it with open_text()")
+        return self._file.getbuffer()
+
+    def open_text(self):
+        """Text stream over the body, from the start"""
+        if self.in_memory:
+            return io.TextIOWrapper(io.BytesIO(self._file.getvalue()), encoding="utf-8")
+        self._file.close()
+        return open(self.path, encoding="utf-8")
+
+    def close(self, delete: bool = True):
+        """Release the buffer; spilled files are removed unless ``delete`` is False"""
+        self._file.close()
+        if self.path and delete:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class _Reader:
+    """Minimal pull parser over a text stream using ``raw_decode`` per value"""
+
+    def __init__(self, fp, chunk_size: int = 65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so the buffer stays around one chunk long
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the response body")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def string(self, max_chars: int) -> str:
+        """
+        Decode the JSON string at the cursor, keeping only its first ``max_chars`` characters
+
+        The rest is skipped chunk by chunk without being held; a cut string
+        ends in "…". Escapes are never split.
+        """
+        self.expect('"')
+        kept, room, cut = [], max_chars, False
+        while True:
+            end = _STRING_RUN.match(self.buf, self.pos).end()
+            if room and not cut:
+                # The longest run of whole escapes and characters that fits
+                fit = _STRING_RUN.match(self.buf, self.pos, min(end, self.pos + room)).end()
+                kept.append(self.buf[self.pos:fit])
+                room -= fit - self.pos
+                cut = fit < end
+            else:
+                cut = cut or end > self.pos
+            self.pos = end
+            if self.buf[end:end + 1] == '"':
+                self.pos += 1
+                break
+            if len(self.buf) - end >= 6:
+                raise ValueError(f"Invalid string escape at offset {end} of the response body")
+            # The buffer ends in the string or partway through an escape
+            if not self._fill():
+                problem = "Invalid string escape" if self.pos < len(self.buf) else "Unterminated string"
+                raise ValueError(f"{problem} in the response body")
+        text = json.loads('"' + "".join(kept) + '"')
+        if not cut:
+            return text
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            text = text[:-1]  # Half of a surrogate pair
+        return text + "…"
+
+
+def iter_members(fp, expand_key: str = "results", max_chars: int = None):
+    """
+    Yield ``(key, value, is_item)`` for a JSON object without loading it whole
+
+    Members are decoded one at a time. The array under ``expand_key`` is
+    yielded item by item with ``is_item`` True, so only one item is held in
+    memory at once. A top-level array is treated as ``expand_key``'s items.
+    Top-level string members longer than ``max_chars`` are cut to that
+    length while streaming (see ``_Reader.string``).
+    """
+    reader = _Reader(fp)
+    first = reader.peek()
+    if first == "[":
+        yield from ((expand_key, item, True) for item in _iter_array(reader))
+        return
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == expand_key and reader.peek() == "[":
+            for item in _iter_array(reader):
+                yield key, item, True
+        elif max_chars and reader.peek() == '"':
+            yield key, reader.string(max_chars), False
+        else:
+            yield key, reader.value(), False
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+def _iter_array(reader: _Reader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("]")
+        return
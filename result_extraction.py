@@ -0,0 +1,213 @@
+import json
+import re
+from config import Config
+import metrics
+
+# Rough size of a token in English page text; avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+RESULT_CHARS = metrics.registry.counter("harpa_result_chars_total",
+                                        "Characters of HARPA results before and after extraction", ("stage",))
+
+_SCRIPT_STYLE = re.compile(r"<(script|style|noscript|svg)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_BLOCK_TAG = re.compile(r"</?(p|div|br|li|tr|h[1-6]|section|article|table|ul|ol)\b[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+_SPACES = re.compile(r"[ \t ]+")
+_PRICE = re.compile(r"(?:[$€£¥]\s?\d[\d,]*(?:\.\d+)?|\d[\d,]*(?:\.\d+)?\s?(?:USD|EUR|GBP|USDT|BTC))")
+# Cookie banners and footers: dropped when a short line starts with one
+_BOILERPLATE = re.compile(
+    r"^(?:©|(?:accept( all)? cookies|we use cookies|cookie (policy|settings)|privacy policy"
+    r"|terms (of (use|service)|& conditions)|all rights reserved|copyright)\b)",
+    re.IGNORECASE,
+)
+# Navigation and widget labels: dropped only when they are the whole line,
+# so "Home Depot drill $99" or "Subscribe & save 15%" survive
+_NAV_LINE = re.compile(
+    r"^(?:menu|home|back to top|skip to (main )?content|sign (in|up|out)|log ?(in|out)|register"
+    r"|subscribe|newsletter|follow us|share( this)?|advertisement|loading|search|cart|my account"
+    r"|wish ?list|help|contact( us)?|about( us)?|careers|site ?map|next|previous|close|see all|view all)"
+    r"[\s.:…>»|]*$",
+    re.IGNORECASE,
+)
+# Boilerplate patterns only apply to short lines so real sentences survive
+_BOILERPLATE_MAX_CHARS = 60
+# "Color: Silver", "Availability: In stock" - facts, never boilerplate
+_KEY_VALUE = re.compile(r"^[^:]{1,40}:\s*\S")
+
+
+def strip_html(text: str) -> str:
+    """Turn markup into plain text lines; plain text passes through unchanged"""
+    if "<" not in text or ">" not in text:
+        return text
+    import html
+    text = _SCRIPT_STYLE.sub(" ", text)
+    text = _BLOCK_TAG.sub("\n", text)
+    return html.unescape(_TAG.sub(" ", text))
+
+
+def _is_boilerplate(line: str) -> bool:
+    if len(line) > _BOILERPLATE_MAX_CHARS or _KEY_VALUE.match(line):
+        return False
+    return bool(_BOILERPLATE.match(line) or _NAV_LINE.match(line))
+
+
+def _table(rows: list) -> list:
+    """Render a list of flat dicts as pipe-separated lines with one header"""
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    lines = [" | ".join(str(column) for column in columns)]
+    for row in rows:
+        lines.append(" | ".join(_clean(str(row.get(column, ""))) for column in columns))
+    return lines
+
+
+def _clean(text: str) -> str:
+    return _SPACES.sub(" ", text).strip()
+
+
+def _is_flat_record(value) -> bool:
+    return isinstance(value, dict) and value and all(not isinstance(v, (dict, list)) for v in value.values())
+
+
+def _as_data(value):
+    # Typed items (e.g. SerpResult streamed from a spilled reply) as plain dicts;
+    # duck-typed so this module never imports pydantic
+    return value.model_dump(exclude_none=True) if hasattr(value, "model_dump") else value
+
+
+def _walk(value, key: str, tables: list, texts: list):
+    value = _as_data(value)
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            _walk(child, child_key, tables, texts)
+    elif isinstance(value, list):
+        value = [_as_data(item) for item in value]
+        if len(value) > 1 and all(_is_flat_record(item) for item in value):
+            tables.append(_table(value))
+        elif len(value) > 1 and all(isinstance(item, list) for item in value):
+            tables.append([" | ".join(_clean(str(cell)) for cell in row) for row in value])
+        else:
+            for item in value:
+                _walk(item, key, tables, texts)
+    elif isinstance(value, str):
+        for line in strip_html(value).splitlines():
+            line = _clean(line)
+            if line and not _is_boilerplate(line):
+                texts.append(line)
+    elif value is not None and key:
+        texts.append(f"{key}: {value}")
+
+
+def parse_result(result):
+    """Decode JSON embedded in a string result, otherwise return it as is"""
+    if isinstance(result, str):
+        stripped = result.strip()
+        if stripped[:1] in ("{", "[") and stripped[-1:] in ("}", "]"):
+            try:
+                return json.loads(stripped)
+            except ValueError:
+                pass
+    return result
+
+
+def extract(result, token_budget: int = None) -> str:
+    """
+    Reduce a HARPA result to dense text for the next prompt
+
+    Parses JSON, strips markup and boilerplate lines, renders lists of
+    records as tables, drops duplicate lines and truncates to
+    ``token_budget`` tokens. When truncating, tables and lines with prices
+    are kept ahead of other text; kept lines stay in page order.
+
+    Args:
+        result: Decoded grid response, or a string (JSON or page text)
+        token_budget: Maximum tokens kept, defaults to ``Config.RESULT_TOKEN_BUDGET``
+    """
+    token_budget = Config.RESULT_TOKEN_BUDGET if token_budget is None else token_budget
+    tables, texts = [], []
+    _walk(parse_result(result), "", tables, texts)
+
+    lines = [line for table in tables for line in table + [""]]
+    seen = set()
+    for line in texts:
+        normalized = line.lower()
+        if normalized not in seen:
+            seen.add(normalized)
+            lines.append(line)
+
+    budget_chars = token_budget * CHARS_PER_TOKEN if token_budget else None
+    if budget_chars is None or sum(len(line) + 1 for line in lines) <= budget_chars:
+        return "\n".join(lines).strip()
+
+    # Over budget: keep tables and priced lines first, then fill with the
+    # rest, and emit the survivors in their original order
+    table_lines = len(lines) - len(seen)
+    order = sorted(range(len(lines)),
+                   key=lambda i: (0 if i < table_lines or _PRICE.search(lines[i]) else 1, i))
+    kept, used = {}, 0
+    for index in order:
+        line = lines[index]
+        remaining = budget_chars - used
+        if len(line) + 1 > remaining:
+            # Cut one long line (e.g. unbroken page text) rather than drop it
+            if remaining > 200:
+                kept[index] = line[:remaining - 2] + "…"
+            break
+        kept[index] = line
+        used += len(line) + 1
+    omitted = len(lines) - len(kept)
+    marker = f"[… {omitted} more lines omitted]" if omitted else "[… truncated]"
+    return "\n".join([kept[i] for i in sorted(kept)] + [marker]).strip()
+
+
+def take_chars(items, max_chars: int) -> list:
+    """Collect items from an iterator until their combined text passes ``max_chars``"""
+    taken, used = [], 0
+    for item in items:
+        taken.append(item)
+        used += len(item) if isinstance(item, str) else len(str(item))
+        if used >= max_chars:
+            break
+    return taken
+
+
+def extraction_settings() -> tuple:
+    """``(extraction, token_budget)`` from ``Config``, to hand to ``condense`` in another process"""
+    return Config.RESULT_EXTRACTION, Config.RESULT_TOKEN_BUDGET
+
+
+def condense(result, extraction: bool = None, token_budget: int = None) -> str:
+    """
+    Text handed to the model for a grid result, without recording metrics
+
+    Args:
+        result: Decoded grid result
+        extraction: Run ``extract``, defaults to ``Config.RESULT_EXTRACTION``
+        token_budget: Passed to ``extract``, defaults to ``Config.RESULT_TOKEN_BUDGET``
+    """
+    if Config.RESULT_EXTRACTION if extraction is None else extraction:
+        return extract(result, token_budget)
+    return result if isinstance(result, str) else str(result)
+
+
+def record_result_chars(raw_chars: int, text_chars: int):
+    RESULT_CHARS.labels(stage="raw").inc(raw_chars)
+    RESULT_CHARS.labels(stage="extracted").inc(text_chars)
+
+
+def summarize_result(result, raw_chars: int = None) -> str:
+    """
+    Text handed to the model for a grid result, with size metrics
+
+    Args:
+        result: Decoded grid result
+        raw_chars: Size of the undecoded response, if already known
+    """
+    if raw_chars is None:
+        raw_chars = len(result) if isinstance(result, str) else len(str(result))
+    text = condense(result)
+    record_result_chars(raw_chars, len(text))
+    return text
@@ -0,0 +1,215 @@
+import contextvars
+import heapq
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from deadlines import TaskInterrupted, current_deadline
+import metrics
+
+# Highest first: a waiting interactive request always goes before a normal
+# one, and normal before batch
+PRIORITIES = ("interactive", "normal", "batch")
+
+QUEUE_WAIT = metrics.registry.histogram("orchestrator_queue_wait_seconds", "Time spent queued for a shared resource",
+                                        ("resource", "priority"))
+QUEUE_DEPTH = metrics.registry.gauge("orchestrator_queue_depth", "Requests waiting for a shared resource",
+                                     ("resource", "priority"))
+TASK_LATENCY = metrics.registry.histogram("orchestrator_task_latency_seconds",
+                                          "Task run time by priority class", ("priority",))
+
+_current = contextvars.ContextVar("scheduling", default=None)
+
+
+def priority_rank(priority: str) -> int:
+    try:
+        return PRIORITIES.index(priority)
+    except ValueError:
+        raise ValueError(f"Unknown priority {priority!r}; expected one of {', '.join(PRIORITIES)}") from None
+
+
+@contextmanager
+def scheduling(priority: str = None, group: str = None):
+    """Run the block as ``priority`` work of ``group`` (usually the tenant)"""
+    priority = priority or Config.DEFAULT_PRIORITY
+    priority_rank(priority)
+    token = _current.set((priority, group or Config.DEFAULT_TENANT))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current() -> tuple:
+    """``(priority, group)`` of the running task"""
+    return _current.get() or (Config.DEFAULT_PRIORITY, Config.DEFAULT_TENANT)
+
+
+_weights = None
+
+
+def get_weights() -> dict:
+    """Group weights from ``Config.TENANT_WEIGHTS_PATH``; unlisted groups weigh 1"""
+    global _weights
+    if _weights is None:
+        weights = {}
+        if Config.TENANT_WEIGHTS_PATH:
+            with open(Config.TENANT_WEIGHTS_PATH) as f:
+                weights = {group: float(weight) for group, weight in json.load(f).items()}
+        _weights = weights
+    return _weights
+
+
+class FairQueue:
+    """
+    Strict priority between classes, weighted fair queuing within a class
+
+    Inside one priority class each group gets a share of pops proportional
+    to its weight, however many items it has queued: a tenant with 10,000
+    queued tasks and one with a single task alternate instead of the single
+    task waiting behind all 10,000. Items carry virtual finish tags
+    (start-time fair queuing), so pushing and popping are O(log n).
+
+    Not thread-safe; callers hold their own lock.
+
+    Args:
+        weights: ``{group: weight}``; unlisted groups weigh 1
+    """
+
+    def __init__(self, weights: dict = None):
+        self.weights = weights or {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual = [0.0] * len(PRIORITIES)
+        self._finish = {}
+        self._depth = [0] * len(PRIORITIES)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, item, priority: str, group: str, cost: float = 1.0):
+        rank = priority_rank(priority)
+        start = max(self._virtual[rank], self._finish.get((rank, group), 0.0))
+        finish = start + cost / self.weights.get(group, 1.0)
+        self._finish[(rank, group)] = finish
+        self._depth[rank] += 1
+        heapq.heappush(self._heap, (rank, finish, next(self._seq), start, item))
+
+    def pop(self):
+        rank, _, _, start, item = heapq.heappop(self._heap)
+        self._virtual[rank] = max(self._virtual[rank], start)
+        self._depth[rank] -= 1
+        return item
+
+    def remove(self, item) -> bool:
+        """Drop a queued ``item`` (e.g. a cancelled waiter); O(n)"""
+        for index, entry in enumerate(self._heap):
+            if entry[4] is item:
+                self._heap[index] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._depth[entry[0]] -= 1
+                return True
+        return False
+
+    def depth(self, priority: str) -> int:
+        return self._depth[priority_rank(priority)]
+
+
+class FairLimiter:
+    """
+    At most ``capacity`` concurrent holders, handed out by ``FairQueue`` order
+
+    Uncontended acquisitions take a slot immediately. A released slot goes
+    straight to the next waiter, so later arrivals cannot jump the queue.
+    Waiters leave the queue as soon as their task is cancelled or out of
+    time (see ``deadlines``).
+
+    Args:
+        resource: Name used in metrics ("model", "grid")
+        capacity: Concurrent slots; 0 disables the limit
+        weights: Group weights for fair queuing
+    """
+
+    def __init__(self, resource: str, capacity: int, weights: dict = None):
+        self.resource = resource
+        self.capacity = capacity
+        self.active = 0
+        self._queue = FairQueue(weights)
+        self._lock = threading.Lock()
+
+    def _set_depth(self, priority: str):
+        QUEUE_DEPTH.labels(resource=self.resource, priority=priority).set(self._queue.depth(priority))
+
+    @contextmanager
+    def slot(self, priority: str = None, group: str = None):
+        """
+        Hold one slot for the block, as the running task unless given ``priority``/``group``
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        if not self.capacity:
+            yield 0.0
+            return
+        if priority is None or group is None:
+            running_priority, running_group = current()
+            priority, group = priority or running_priority, group or running_group
+        queued_at = time.monotonic()
+        entry = None
+        with self._lock:
+            if self.active < self.capacity and not self._queue:
+                self.active += 1
+            else:
+                entry = (threading.Event(), priority)
+                self._queue.push(entry, priority, group)
+                self._set_depth(priority)
+        if entry is not None:
+            self._wait(entry)
+        waited = time.monotonic() - queued_at
+        QUEUE_WAIT.labels(resource=self.resource, priority=priority).observe(waited)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    def _wait(self, entry: tuple):
+        waiter, priority = entry
+        deadline = current_deadline()
+        while not waiter.wait(deadline.poll_timeout()):
+            try:
+                deadline.check()
+            except TaskInterrupted:
+                with self._lock:
+                    removed = self._queue.remove(entry)
+                    self._set_depth(priority)
+                if not removed:
+                    # The slot was handed over just now; pass it on
+                    self._release()
+                raise
+
+    def _release(self):
+        with self._lock:
+            if self._queue:
+                # Hand the slot over without freeing it
+                waiter, priority = self._queue.pop()
+                self._set_depth(priority)
+                waiter.set()
+            else:
+                self.active -= 1
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(resource: str) -> FairLimiter:
+    """Process-wide limiter for "model" or "grid" calls, sized from ``Config``"""
+    limiter = _limiters.get(resource)
+    if limiter is None:
+        capacity = {"model": Config.MODEL_MAX_CONCURRENCY, "grid": Config.GRID_MAX_CONCURRENCY}[resource]
+        with _limiters_lock:
+            limiter = _limiters.setdefault(resource, FairLimiter(resource, capacity, get_weights()))
+    return limiter
@@ -0,0 +1,398 @@
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+from log_utils import get_logger
+from scheduling import QUEUE_DEPTH, QUEUE_WAIT, FairQueue, get_weights, priority_rank
+
+logger = get_logger("server")
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+# Task IDs and tenants name state files, so only plain file-name characters are accepted
+ID_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}")
+
+
+def check_id(name: str, value):
+    """Raise ``ValueError`` unless ``value`` is None or a safe task ID / tenant name"""
+    if value is not None and not (isinstance(value, str) and ID_PATTERN.fullmatch(value)):
+        raise ValueError(f"'{name}' must be 1-128 letters, digits, '_', '-' or '.' and not start with '.'")
+
+
+class ServerBusy(Exception):
+    """Raised when ``SERVER_MAX_JOBS`` jobs are queued or running and none can be evicted"""
+
+
+class Job:
+    """A submitted task plus its progress events and outcome"""
+
+    def __init__(self, task: str, task_id: str, tenant: str = None, priority: str = None, deadline: float = None):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.task_id = task_id
+        self.tenant = tenant
+        self.priority = priority or Config.DEFAULT_PRIORITY
+        self.deadline = deadline
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.cancel_event = threading.Event()
+        self.condition = threading.Condition()
+
+    def add_event(self, event: dict):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def start(self) -> bool:
+        """Move a queued job to "running"; False if it was cancelled or finished first"""
+        with self.condition:
+            if self.cancel_event.is_set() or self.status != "queued":
+                return False
+            self.status = "running"
+            self.events.append({"type": "started"})
+            self.condition.notify_all()
+            return True
+
+    def finish(self, status: str, result=None, error=None):
+        """Record the outcome; a job only finishes once, later calls are ignored"""
+        with self.condition:
+            if self.status in FINISHED_STATUSES:
+                return
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self.events.append({"type": "finished", "status": status})
+            self.condition.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "task": self.task,
+            "task_id": self.task_id,
+            "tenant": self.tenant,
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "iterations": sum(1 for event in self.events if event["type"] == "iteration"),
+            "error": self.error,
+        }
+
+
+class TaskManager:
+    """
+    Runs submitted tasks on a shared Orchestrator in a thread pool
+
+    Submission only enqueues work, so it returns immediately; every task
+    shares the orchestrator's warm OpenAI client and HARPA connection pool.
+    Queued jobs start in priority order, and tenants within a priority
+    class take turns in proportion to their weights (see ``FairQueue``).
+    """
+
+    def __init__(self, orchestrator=None, max_workers: int = None, max_jobs: int = None):
+        if orchestrator is None:
+            from orchestrator import get_orchestrator
+            orchestrator = get_orchestrator()
+        self.orchestrator = orchestrator
+        self.max_jobs = max_jobs or Config.SERVER_MAX_JOBS
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or Config.SERVER_WORKERS,
+                                       thread_name_prefix="task")
+        self.jobs = {}
+        self.queue = FairQueue(get_weights())
+        self.lock = threading.Lock()
+
+    def submit(self, task: str, task_id: str = None, tenant: str = None, priority: str = None,
+               deadline: float = None) -> Job:
+        """
+        Queue a task
+
+        ``deadline`` is in seconds from submission, so time spent queued counts.
+
+        Raises:
+            ValueError: unknown priority, a deadline that is not a positive
+                number, or a task ID or tenant that is not a plain file name
+                (see ``ID_PATTERN``)
+            ServerBusy: ``max_jobs`` jobs are tracked and none has finished
+        """
+        check_id("task_id", task_id)
+        check_id("tenant", tenant)
+        job = Job(task, task_id or f"job_{uuid.uuid4().hex[:12]}", tenant, priority, deadline)
+        priority_rank(job.priority)
+        if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float))):
+            raise ValueError("'deadline' must be a number of seconds")
+        if deadline is not None and deadline <= 0:
+            raise ValueError("deadline must be positive")
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+            self.queue.push(job, job.priority, tenant or Config.DEFAULT_TENANT)
+            QUEUE_DEPTH.labels(resource="task", priority=job.priority).set(self.queue.depth(job.priority))
+        # Each pool slot runs whichever queued job is due next, not necessarily this one
+        self.pool.submit(self._run_next)
+        return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is not None:
+            # Same lock as Job.start, so a job is either cancelled while queued
+            # or stopped by its cancel_event once running, never both
+            with job.condition:
+                if job.status not in FINISHED_STATUSES:
+                    job.cancel_event.set()
+                    if job.status == "queued":
+                        job.finish("cancelled")
+        return job
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        self.pool.shutdown(wait=True)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once over the retention limit; queued
+        # and running jobs are never dropped, so a full server turns work away
+        excess = len(self.jobs) - self.max_jobs + 1
+        if excess <= 0:
+            return
+        finished = sorted(
+            (job for job in self.jobs.values() if job.status in FINISHED_STATUSES),
+            key=lambda job: job.finished_at
+        )
+        if len(finished) < excess:
+            raise ServerBusy(f"{len(self.jobs) - len(finished)} jobs queued or running; try again later")
+        for job in finished[:excess]:
+            del self.jobs[job.id]
+
+    def _run_next(self):
+        with self.lock:
+            job = self.queue.pop()
+            QUEUE_DEPTH.labels(resource="task", priority=job.priority).set(self.queue.depth(job.priority))
+        self._run(job)
+
+    def _run(self, job: Job):
+        queued = time.time() - job.submitted_at
+        if job.deadline is not None and queued >= job.deadline:
+            job.finish("failed", error="deadline exceeded before the task started")
+            return
+        if not job.start():
+            return
+        QUEUE_WAIT.labels(resource="task", priority=job.priority).observe(queued)
+        try:
+            result = self.orchestrator.run_task(
+                job.task, job.task_id,
+                on_event=job.add_event,
+                cancel_event=job.cancel_event,
+                tenant=job.tenant,
+                priority=job.priority,
+                deadline=job.deadline - queued if job.deadline is not None else None
+            )
+        except Exception as e:
+            job.finish("failed", error=str(e))
+            return
+
+        if job.cancel_event.is_set() and result is None:
+            job.finish("cancelled")
+        elif result is None and any(event["type"] == "deadline_exceeded" for event in job.events):
+            job.finish("failed", error="deadline exceeded")
+        elif result is None:
+            job.finish("failed")
+        else:
+            job.finish("completed", result=result)
+
+
+class TaskRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API for task submission
+
+    POST   /tasks                 submit {"task", "task_id", "tenant", "priority", "deadline"}
+    GET    /tasks/<id>            job status
+    GET    /tasks/<id>/result     final result (202 while still running)
+    GET    /tasks/<id>/events     progress as server-sent events
+    POST   /tasks/<id>/cancel     cancel (DELETE /tasks/<id> also works)
+    GET    /health                liveness check
+    GET    /metrics               Prometheus metrics
+    GET    /domains               per-domain grid queue depth and active requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def manager(self) -> TaskManager:
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        if Config.SERVER_ACCESS_LOG:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_metrics(self):
+        import metrics
+        data = metrics.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _route(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if not parts or parts[0] != "tasks":
+            return parts, None
+        job = self.manager.get(parts[1]) if len(parts) > 1 else None
+        return parts, job
+
+    def do_GET(self):
+        parts, job = self._route()
+        if parts == ["health"]:
+            return self._send_json(200, {"status": "ok"})
+        if parts == ["metrics"]:
+            return self._send_metrics()
+        if parts == ["domains"]:
+            from politeness import get_scheduler
+            return self._send_json(200, get_scheduler().snapshot())
+        if len(parts) < 2 or parts[0] != "tasks":
+            return self._send_json(404, {"error": "not found"})
+        if job is None:
+            return self._send_json(404, {"error": "unknown task"})
+
+        if len(parts) == 2:
+            return self._send_json(200, job.to_dict())
+        if parts[2] == "result":
+            if job.status not in FINISHED_STATUSES:
+                return self._send_json(202, job.to_dict())
+            return self._send_json(200, dict(job.to_dict(), result=job.result))
+        if parts[2] == "events":
+            return self._stream_events(job)
+        return self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts, job = self._route()
+        if parts == ["tasks"]:
+            try:
+                body = self._read_json()
+            except ValueError:
+                return self._send_json(400, {"error": "invalid JSON"})
+            if not isinstance(body, dict) or not body.get("task"):
+                return self._send_json(400, {"error": "'task' is required"})
+            try:
+                job = self.manager.submit(body["task"], body.get("task_id"), body.get("tenant"),
+                                          body.get("priority"), body.get("deadline"))
+            except (TypeError, ValueError) as e:
+                return self._send_json(400, {"error": str(e)})
+            except ServerBusy as e:
+                return self._send_json(503, {"error": str(e)})
+            return self._send_json(202, job.to_dict())
+        if len(parts) == 3 and parts[0] == "tasks" and parts[2] == "cancel":
+            return self._cancel(job)
+        return self._send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        parts, job = self._route()
+        if len(parts) == 2 and parts[0] == "tasks":
+            return self._cancel(job)
+        return self._send_json(404, {"error": "not found"})
+
+    def _cancel(self, job):
+        if job is None:
+            return self._send_json(404, {"error": "unknown task"})
+        self.manager.cancel(job.id)
+        return self._send_json(202, job.to_dict())
+
+    def _stream_events(self, job: Job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        sent = 0
+        try:
+            while True:
+                with job.condition:
+                    if sent == len(job.events) and job.status not in FINISHED_STATUSES:
+                        job.condition.wait(timeout=15)
+                    pending = job.events[sent:]
+                    finished = job.status in FINISHED_STATUSES
+                sent += len(pending)
+
+                if not pending and not finished:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in pending:
+                    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+                if finished and sent == len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+class TaskServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, manager: TaskManager):
+        super().__init__(address, TaskRequestHandler)
+        self.manager = manager
+
+
+def serve(host: str = None, port: int = None, orchestrator=None):
+    """Run the task server until interrupted"""
+    manager = TaskManager(orchestrator)
+    server = TaskServer((host or Config.SERVER_HOST, port or Config.SERVER_PORT), manager)
+    logger.info("🛰️ Task server listening on http://%s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("\n🛑 Shutting down task server")
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='HTTP task server for the HARPA orchestrator')
+    parser.add_argument('--host', type=str, default=Config.SERVER_HOST, help='Bind address')
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT, help='Port')
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+
+    args = parser.parse_args()
+
+    from log_utils import configure_logging
+    configure_logging(debug=args.debug)
+
+    from orchestrator import validate_api_keys
+    if not validate_api_keys():
+        exit(1)
+    serve(args.host, args.port)
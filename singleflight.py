@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "done_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception). With
+    ``linger`` > 0 a successful result is also handed to identical calls
+    arriving up to ``linger`` seconds after it finished.
+
+    Args:
+        linger: Seconds to keep serving a finished result
+    """
+
+    def __init__(self, linger: float = 0.0):
+        self.linger = linger
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        expired = [key for key, call in self._calls.items()
+                   if call.done_at is not None and now - call.done_at > self.linger]
+        for key in expired:
+            del self._calls[key]
+
+    def do(self, key, fn) -> tuple:
+        """
+        Run ``fn()`` unless an identical call is already in flight
+
+        Returns:
+            ``(result, shared)``; ``shared`` is True when the result came
+            from another caller's execution
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done_at is not None and time.monotonic() - call.done_at > self.linger:
+                call = None
+            leader = call is None
+            if leader:
+                self._expire(time.monotonic())
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self.linger and call.error is None:
+                    call.done_at = time.monotonic()
+                elif self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(1 for call in self._calls.values() if call.done_at is None)
@@ -0,0 +1,196 @@
+import json
+import re
+from collections import deque
+from config import Config
+from log_utils import get_logger
+
+logger = get_logger("sites")
+
+# name -> canonical URL, aliases matched in commands, preferred fallback
+# action and named CSS selectors for scraping
+DEFAULT_SITES = {
+    "google": {"url": "https://www.google.com", "aliases": ["google", "google.com"], "action": "serp"},
+    "binance": {
+        "url": "https://www.binance.com",
+        "aliases": ["binance", "binance.com"],
+        "action": "scrape",
+    },
+    "bestbuy": {
+        "url": "https://www.bestbuy.com",
+        "aliases": ["best buy", "bestbuy", "bestbuy.com"],
+        "action": "command",
+    },
+    "amazon": {"url": "https://www.amazon.com", "aliases": ["amazon", "amazon.com"], "action": "command"},
+    "ebay": {"url": "https://www.ebay.com", "aliases": ["ebay", "ebay.com"], "action": "command"},
+    "walmart": {"url": "https://www.walmart.com", "aliases": ["walmart", "walmart.com"], "action": "command"},
+    "wikipedia": {
+        "url": "https://en.wikipedia.org",
+        "aliases": ["wikipedia", "wikipedia.org", "wiki"],
+        "action": "scrape",
+        "selectors": {"content": "#mw-content-text"},
+    },
+    "github": {"url": "https://github.com", "aliases": ["github", "github.com"], "action": "command"},
+    "youtube": {"url": "https://www.youtube.com", "aliases": ["youtube", "youtube.com"], "action": "command"},
+    "reddit": {"url": "https://www.reddit.com", "aliases": ["reddit", "reddit.com"], "action": "command"},
+    "linkedin": {"url": "https://www.linkedin.com", "aliases": ["linkedin", "linkedin.com"], "action": "command"},
+    "yahoo_finance": {
+        "url": "https://finance.yahoo.com",
+        "aliases": ["yahoo finance", "finance.yahoo.com"],
+        "action": "scrape",
+    },
+    "coinmarketcap": {
+        "url": "https://coinmarketcap.com",
+        "aliases": ["coinmarketcap", "coinmarketcap.com", "cmc"],
+        "action": "scrape",
+    },
+}
+
+# Bare domains such as "bestbuy.com/site/returns" that are not registered
+DOMAIN_PATTERN = re.compile(r"\b((?:[a-z0-9-]+\.)+(?:com|org|net|io|ai|co|edu|gov|dev|app|uk|de|fr|ca))(/[^\s,;]*)?",
+                            re.IGNORECASE)
+
+
+class Site:
+    __slots__ = ("name", "url", "aliases", "action", "selectors")
+
+    def __init__(self, name: str, url: str, aliases: list = (), action: str = "command", selectors: dict = None):
+        self.name = name
+        self.url = url
+        self.aliases = list(aliases) or [name]
+        self.action = action
+        self.selectors = selectors or {}
+
+    def __repr__(self):
+        return f"Site({self.name!r}, {self.url!r})"
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: finds every pattern in a text in one pass
+
+    Build cost is linear in the total pattern length; ``search`` is
+    O(len(text) + matches) however many patterns are registered.
+    """
+
+    def __init__(self, patterns: dict):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            state = 0
+            for char in pattern:
+                state = self._goto[state].get(char) or self._add_state(state, char)
+            self._out[state].append((len(pattern), value))
+        self._link()
+
+    def _add_state(self, parent: int, char: str) -> int:
+        self._goto.append({})
+        self._fail.append(0)
+        self._out.append([])
+        state = len(self._goto) - 1
+        self._goto[parent][char] = state
+        return state
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str):
+        """Yield ``(start, end, value)`` for every pattern occurrence"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in out[state]:
+                yield index - length + 1, index + 1, value
+
+
+def _is_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not (before.isalnum() or after.isalnum())
+
+
+class SiteRegistry:
+    """
+    Sites by name and alias, resolved from free-text commands
+
+    Args:
+        sites: ``{name: {"url", "aliases", "action", "selectors"}}``
+    """
+
+    def __init__(self, sites: dict):
+        self.sites = {name: Site(name, **entry) for name, entry in sites.items()}
+        aliases = {}
+        for site in self.sites.values():
+            for alias in site.aliases:
+                aliases.setdefault(alias.lower(), site)
+        self._matcher = AhoCorasick(aliases)
+
+    @classmethod
+    def load(cls, path: str = None) -> "SiteRegistry":
+        """Default sites, extended or overridden by the JSON file at ``path``"""
+        sites = {name: dict(entry) for name, entry in DEFAULT_SITES.items()}
+        path = path or Config.SITE_REGISTRY_PATH
+        if path:
+            with open(path) as f:
+                sites.update(json.load(f))
+        return cls(sites)
+
+    def match(self, text: str):
+        """
+        The site mentioned first in ``text`` (longest alias wins at a position), or None
+
+        Aliases only match as whole words, so "cmc" does not match "cmcsa".
+        """
+        lowered = text.lower()
+        best = None
+        for start, end, site in self._matcher.search(lowered):
+            if not _is_boundary(lowered, start, end):
+                continue
+            if best is None or start < best[0] or (start == best[0] and end > best[1]):
+                best = (start, end, site)
+        return best[2] if best else None
+
+    def resolve(self, command: str, url_pattern) -> tuple:
+        """
+        ``(url, site)`` for a command
+
+        An explicit URL wins, then a bare domain with a path such as
+        ``bestbuy.com/site/returns``, then a registered site, then any bare
+        domain. Only when nothing matches does it fall back to
+        ``Config.DEFAULT_SITE_URL`` (``site`` is None then).
+        """
+        urls = url_pattern.findall(command)
+        if urls:
+            return urls[0], self.match(urls[0])
+        site = self.match(command)
+        domain = DOMAIN_PATTERN.search(command)
+        if domain and (site is None or domain.group(2)):
+            url = f"https://{domain.group(1).lower()}{domain.group(2) or ''}"
+            return url, self.match(url)
+        if site:
+            return site.url, site
+        logger.debug("No site found in command, using %s", Config.DEFAULT_SITE_URL)
+        return Config.DEFAULT_SITE_URL, None
+
+
+_registry = None
+
+
+def get_registry() -> SiteRegistry:
+    """Return the process-wide registry, built on first use"""
+    global _registry
+    if _registry is None:
+        _registry = SiteRegistry.load()
+    return _registry
@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from config import Config
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parse ``python -X importtime`` output
+
+    Returns:
+        List of ``(module, self_us, cumulative_us)`` sorted by cumulative time
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|")
+            rows.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def import_report(module: str = "orchestrator") -> list:
+    """Import ``module`` in a fresh interpreter with ``-X importtime``"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def time_command(argv: list, runs: int = 5) -> float:
+    """Return the median wall time in milliseconds of running ``argv``"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=HERE, capture_output=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure orchestrator startup time')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per timed command')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to show')
+    parser.add_argument('--budget-ms', type=float, default=Config.STARTUP_BUDGET_MS, help='Fail if --help exceeds this')
+
+    args = parser.parse_args()
+
+    rows = import_report()
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, self_us, cumulative_us in rows[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+
+    baseline_ms = time_command([sys.executable, "-c", "pass"], args.runs)
+    help_ms = time_command([sys.executable, "orchestrator.py", "--help"], args.runs)
+    print(f"\n🐍 Bare interpreter:       {baseline_ms:.1f} ms")
+    print(f"🚀 orchestrator.py --help: {help_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if help_ms > args.budget_ms:
+        print("❌ Startup budget exceeded")
+        raise SystemExit(1)
+    print("✅ Startup within budget")
@@ -1,15 +1,197 @@
-import json
 import os
+import tempfile
+from contextlib import contextmanager
 from config import Config
+import state_serializers
 
-def save_state(task_id: str, state: dict):
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to msvcrt byte-range locks
+    fcntl = None
+    import msvcrt
+
+
+class StateConflictError(Exception):
+    """Raised when a save is based on an out-of-date state version"""
+
+
+def _task_file(task_id: str, suffix: str) -> str:
+    """Path of a task's file in ``PERSISTENT_DIR``; raises ``ValueError`` if the ID would leave it"""
+    root = os.path.realpath(Config.PERSISTENT_DIR)
+    path = os.path.join(Config.PERSISTENT_DIR, f"{task_id}{suffix}")
+    if os.path.dirname(os.path.realpath(path)) != root:
+        raise ValueError(f"Task ID {task_id!r} points outside {Config.PERSISTENT_DIR}")
+    return path
+
+
+def _state_path(task_id: str) -> str:
+    # The name stays "_state.json" whatever STATE_FORMAT is: the format is read
+    # from the file's own header, so migrating re-encodes in place and task
+    # IDs, lock files and tooling never depend on the codec
+    return _task_file(task_id, "_state.json")
+
+
+def _lock_path(task_id: str) -> str:
+    return _task_file(task_id, "_state.lock")
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive advisory lock on ``path`` (created if missing)"""
+    with open(path, "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def task_lock(task_id: str):
+    """
+    Hold an exclusive advisory lock for a task's state file
+
+    The lock lives in a sidecar ``.lock`` file so it survives the atomic
+    rename of the state file itself. Nested use from one process is not
+    supported.
+    """
     os.makedirs(Config.PERSISTENT_DIR, exist_ok=True)
-    with open(f"{Config.PERSISTENT_DIR}/{task_id}_state.json", "w") as f:
-        json.dump(state, f, indent=2)
+    with file_lock(_lock_path(task_id)):
+        yield
+
+
+def _read_state(task_id: str):
+    try:
+        with open(_state_path(task_id), "rb") as f:
+            return state_serializers.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path: str, state: dict, codec: str = None, compression: str = None):
+    data = state_serializers.dumps(
+        state,
+        codec=codec or Config.STATE_FORMAT,
+        compression=compression or Config.STATE_COMPRESSION,
+    )
+    write_bytes_atomic(path, data)
+
+
+def write_bytes_atomic(path: str, data: bytes):
+    """Write ``data`` to ``path`` so readers only ever see the old or the new complete file"""
+    # Write to a temp file in the same directory, then rename over the target
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def save_state(task_id: str, state: dict):
+    """
+    Atomically persist task state with compare-and-swap versioning
+
+    ``state["version"]`` must match the version currently on disk (states
+    without a version are treated as version 0). On success the version is
+    bumped in place so the caller can keep saving the same dict.
+
+    Raises:
+        StateConflictError: another worker saved this task in the meantime
+    """
+    with task_lock(task_id):
+        current = _read_state(task_id)
+        current_version = current.get("version", 0) if current else 0
+        expected_version = state.get("version", 0)
+        if expected_version != current_version:
+            raise StateConflictError(
+                f"State for '{task_id}' is at version {current_version}, "
+                f"but save was based on version {expected_version}"
+            )
+        new_state = dict(state, version=current_version + 1)
+        _write_atomic(_state_path(task_id), new_state)
+        state["version"] = new_state["version"]
+
 
 def load_state(task_id: str) -> dict:
+    state = _read_state(task_id)
+    if state is None:
+        return {"task": task_id, "progress": [], "version": 0}
+    state.setdefault("version", 0)
+    return state
+
+
+def update_state(task_id: str, update_fn) -> dict:
+    """
+    Apply ``update_fn(state)`` to the latest state under the task lock
+
+    Use this for read-modify-write changes that must not lose concurrent
+    updates. ``update_fn`` may mutate the state in place or return a new dict.
+    """
+    with task_lock(task_id):
+        state = load_state(task_id)
+        new_state = update_fn(state)
+        if new_state is None:
+            new_state = state
+        new_state["version"] = state["version"] + 1
+        _write_atomic(_state_path(task_id), new_state)
+    return new_state
+
+
+def migrate_state(task_id: str, codec: str = None, compression: str = None) -> tuple:
+    """
+    Re-encode a task's state file in place without changing its version
+
+    Returns:
+        ``(old_size, new_size)`` in bytes
+    """
+    path = _state_path(task_id)
+    with task_lock(task_id):
+        old_size = os.path.getsize(path)
+        state = _read_state(task_id)
+        _write_atomic(path, state, codec=codec, compression=compression)
+        return old_size, os.path.getsize(path)
+
+
+def list_task_ids() -> list:
+    """Return the IDs of all tasks with a state file in ``Config.PERSISTENT_DIR``"""
     try:
-        with open(f"{Config.PERSISTENT_DIR}/{task_id}_state.json", "r") as f:
-            return json.load(f)
+        names = os.listdir(Config.PERSISTENT_DIR)
     except FileNotFoundError:
-        return {"task": task_id, "progress": []}
+        return []
+    suffix = "_state.json"
+    return sorted(name[:-len(suffix)] for name in names if name.endswith(suffix))
+
+
+class StateStore:
+    """
+    Default state store backed by the files in ``Config.PERSISTENT_DIR``
+
+    Orchestrator only needs ``load`` and ``save``; any object providing them
+    (e.g. a database-backed store) can be injected instead.
+    """
+
+    def load(self, task_id: str) -> dict:
+        return load_state(task_id)
+
+    def save(self, task_id: str, state: dict):
+        save_state(task_id, state)
+
+    def update(self, task_id: str, update_fn) -> dict:
+        return update_state(task_id, update_fn)
@@ -0,0 +1,130 @@
+import gzip
+import json
+
+# Files written in a non-plain-JSON format start with this header:
+#   MAGIC (3 bytes) | header version | codec id | compression id
+# Plain JSON (legacy or compact, uncompressed) is written without a header so
+# old tooling like `python -m json.tool` keeps working on those files.
+MAGIC = b"HST"
+HEADER_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 3
+
+CODECS = {"json": 0, "json-compact": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "gzip": 1, "zstd": 2}
+
+_CODEC_NAMES = {v: k for k, v in CODECS.items()}
+_COMPRESSION_NAMES = {v: k for k, v in COMPRESSIONS.items()}
+
+
+class StateFormatError(Exception):
+    """Raised when a state file cannot be encoded or decoded"""
+
+
+def _require(module_name: str, format_name: str):
+    try:
+        return __import__(module_name)
+    except ImportError:
+        raise StateFormatError(
+            f"State format '{format_name}' needs the optional '{module_name}' "
+            f"package (pip install {module_name})"
+        ) from None
+
+
+def _encode(state: dict, codec: str) -> bytes:
+    if codec == "json":
+        return json.dumps(state, indent=2).encode("utf-8")
+    if codec == "json-compact":
+        return json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if codec == "msgpack":
+        return _require("msgpack", codec).packb(state, use_bin_type=True)
+    raise StateFormatError(f"Unknown state codec: {codec}")
+
+
+def _decode(data: bytes, codec: str) -> dict:
+    if codec in ("json", "json-compact"):
+        return json.loads(data)
+    if codec == "msgpack":
+        return _require("msgpack", codec).unpackb(data, raw=False)
+    raise StateFormatError(f"Unknown state codec: {codec}")
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    """Compress bytes with "none", "gzip" or "zstd" (zstd needs the optional zstandard package)"""
+    if compression == "none":
+        return data
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == "zstd":
+        return _require("zstandard", compression).ZstdCompressor(level=3).compress(data)
+    raise StateFormatError(f"Unknown state compression: {compression}")
+
+
+def compressor(fileobj, compression: str, size: int = -1):
+    """
+    Writable stream compressing into ``fileobj`` the way ``compress`` does
+
+    Close it to finish the stream; ``fileobj`` may be closed with it.
+    ``size`` is the total input length if known (zstd records it in the
+    frame so ``decompress`` can read the result).
+    """
+    if compression == "none":
+        return fileobj
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6, mtime=0)
+    if compression == "zstd":
+        return _require("zstandard", compression).ZstdCompressor(level=3).stream_writer(fileobj, size=size,
+                                                                                         closefd=False)
+    raise StateFormatError(f"Unknown state compression: {compression}")
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    """Reverse ``compress``"""
+    if compression == "none":
+        return data
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        return _require("zstandard", compression).ZstdDecompressor().decompress(data)
+    raise StateFormatError(f"Unknown state compression: {compression}")
+
+
+def dumps(state: dict, codec: str = "json-compact", compression: str = "none") -> bytes:
+    """
+    Serialize a state dict to bytes
+
+    Args:
+        state: Task state to encode
+        codec: One of "json", "json-compact" or "msgpack"
+        compression: One of "none", "gzip" or "zstd"
+    """
+    if codec not in CODECS:
+        raise StateFormatError(f"Unknown state codec: {codec}")
+    if compression not in COMPRESSIONS:
+        raise StateFormatError(f"Unknown state compression: {compression}")
+
+    body = _encode(state, codec)
+    if codec in ("json", "json-compact") and compression == "none":
+        return body
+
+    header = MAGIC + bytes([HEADER_VERSION, CODECS[codec], COMPRESSIONS[compression]])
+    return header + compress(body, compression)
+
+
+def sniff(data: bytes):
+    """Return the ``(codec, compression)`` a serialized state was written with"""
+    if not data.startswith(MAGIC):
+        return "json", "none"
+    if len(data) < HEADER_SIZE or data[3] != HEADER_VERSION:
+        raise StateFormatError("Unsupported state file header")
+    try:
+        return _CODEC_NAMES[data[4]], _COMPRESSION_NAMES[data[5]]
+    except KeyError:
+        raise StateFormatError("Unknown codec or compression in state file header") from None
+
+
+def loads(data: bytes) -> dict:
+    """Deserialize state bytes written by ``dumps`` or by older plain-JSON versions"""
+    codec, compression = sniff(data)
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+    return _decode(decompress(data[HEADER_SIZE:], compression), codec)
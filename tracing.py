@@ -0,0 +1,214 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from log_utils import get_logger
+
+logger = get_logger("tracing")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed phase of a task; durations use the monotonic clock"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_unix_ns",
+                 "_start_perf_ns", "duration_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_unix_ns = time.time_ns()
+        self._start_perf_ns = time.perf_counter_ns()
+        self.duration_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration_ns = time.perf_counter_ns() - self._start_perf_ns
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration_ns or 0) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_unix_ns": self.start_unix_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Collects spans per trace and hands each finished trace to exporters
+
+    A trace finishes when its root span ends; spans ending after that are
+    dropped rather than kept. With no exporters registered spans are still
+    timed but discarded, so instrumentation costs little.
+    """
+
+    def __init__(self):
+        self.exporters = []
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter):
+        """Register ``exporter(spans)``, called once per finished trace"""
+        self.exporters.append(exporter)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        if parent is None and self.exporters:
+            with self._lock:
+                self._traces[trace_id] = []
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end()
+            _current_span.reset(token)
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool):
+        if not self.exporters:
+            return
+        with self._lock:
+            spans = self._traces.pop(span.trace_id, None) if is_root else self._traces.get(span.trace_id)
+            if spans is None:
+                if not is_root:
+                    return  # A late span whose trace was already exported
+                spans = []
+            spans.append(span)
+        if is_root:
+            for exporter in self.exporters:
+                try:
+                    exporter(spans)
+                except Exception as e:
+                    logger.warning("⚠️ Trace exporter failed: %s", e)
+
+
+def current_span():
+    """Return the active span, or None outside of any span"""
+    return _current_span.get()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: list, service_name: str = "harpa-orchestrator") -> dict:
+    """Convert spans to the OTLP/JSON ``ExportTraceServiceRequest`` layout"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "orchestrator"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_unix_ns),
+                    "endTimeUnixNano": str(span.start_unix_ns + (span.duration_ns or 0)),
+                    "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1},
+                } for span in spans],
+            }],
+        }]
+    }
+
+
+def summarize(spans: list) -> dict:
+    """Aggregate wall time per span name, plus the root span's attributes"""
+    import statistics
+    root = next((span for span in spans if span.parent_id is None), None)
+    phases = {}
+    for span in spans:
+        phases.setdefault(span.name, []).append(span.duration_ms)
+    return {
+        "trace_id": root.trace_id if root else None,
+        "root": root.name if root else None,
+        "attributes": root.attributes if root else {},
+        "total_ms": root.duration_ms if root else None,
+        "phases": {
+            name: {
+                "count": len(durations),
+                "total_ms": sum(durations),
+                "p50_ms": statistics.median(durations),
+                "max_ms": max(durations),
+            }
+            for name, durations in sorted(phases.items(), key=lambda item: -sum(item[1]))
+        },
+    }
+
+
+def file_exporter(directory: str):
+    """Return an exporter writing ``<trace>.otlp.json`` and ``<trace>.summary.json`` files"""
+    def export(spans: list):
+        os.makedirs(directory, exist_ok=True)
+        summary = summarize(spans)
+        prefix = f"{summary['attributes'].get('task_id', 'trace')}_{summary['trace_id']}"
+        with open(os.path.join(directory, f"{prefix}.otlp.json"), "w") as f:
+            json.dump(to_otlp(spans), f)
+        with open(os.path.join(directory, f"{prefix}.summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+    return export
+
+
+def otlp_http_exporter(endpoint: str, timeout: float = 5.0):
+    """Return an exporter POSTing OTLP/JSON to a collector's ``/v1/traces`` endpoint"""
+    url = endpoint.rstrip("/")
+    if not url.endswith("/v1/traces"):
+        url += "/v1/traces"
+
+    def export(spans: list):
+        import urllib.request
+        request = urllib.request.Request(
+            url, data=json.dumps(to_otlp(spans)).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=timeout):
+            pass
+    return export
+
+
+tracer = Tracer()
+
+if Config.TRACE_DIR:
+    tracer.add_exporter(file_exporter(Config.TRACE_DIR))
+if Config.OTLP_ENDPOINT:
+    tracer.add_exporter(otlp_http_exporter(Config.OTLP_ENDPOINT))